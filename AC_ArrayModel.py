@@ -0,0 +1,437 @@
+""" This module holds an array-backed version of the whole population. Instead
+of Cell, ProductRule and Product instances, the state of a run is a handful
+of NumPy arrays:
+
+    rules     (cells x types x types)  count of rules of each input/output
+    energy    (cells x types x cap)    the energy of each stored product
+    size      (cells x types)          how many products are stored
+    urn       (types)                  products left in an endogenous urn
+    positions (cells x 2)              location on the torus
+    neighbors (cells x cells)          who can pass to whom
+
+Product types are 1..n in the rest of the model but are indices 0..n-1 here.
+A cell's stored products of a type are a stack, like its lists of Products:
+the last one stored is the first one taken. Energy is a float used up by
+the same subtractions as a Product's, so a product with initial energy 10
+and costs of 1/3 has 3.3e-16 left after 30 of them, not 0, and the same
+products run out of energy as in the object model. The methods below
+follow the chain_step / receive_product / reproduce_active_rule /
+remove_random_rule logic of AC_Cells and AC_Space, but pick cells, rules
+and neighbors from the arrays in their own way, so runs agree with the
+object model's in distribution rather than step for step.
+
+
+Written by Jon Atwell
+"""
+
+import numpy
+
+
+CAPACITY = 16       # stored products per cell and type to start with
+
+
+class ArrayModel:
+    """ The population as arrays. The urn types and codes are the same as
+    in AC_Products.Urn (1 = fixed-rich, 2 = fixed-poor, 3 = endo-rich,
+    4 = endo-poor).
+    """
+
+    def __init__(self, count_cells, count_product_types, RNG, urn_type,
+        energy_costs, initial_energy, count_products=200, selective=False,
+        reproduction_type="source", topology="spatial", radius=1.5,
+        dimensions=(10,10)):
+
+        self.RNG = RNG
+        self.count_cells = count_cells
+        self.maxtype = count_product_types
+        self.count_products = count_products
+        self.selective = selective
+        self.repro_type = reproduction_type
+        self.topology = topology
+        self.radius = radius
+        self.max_x = dimensions[0]
+        self.max_y = dimensions[1]
+        self.master_count = 0
+        self.last_added_rule = 0
+
+        if "fixed-rich" in urn_type:
+            self.urn_type = 1
+        elif "fixed-poor" in urn_type:
+            self.urn_type = 2
+        elif "endo-rich" in urn_type:
+            self.urn_type = 3
+        elif "endo-poor" in urn_type:
+            self.urn_type = 4
+        else:
+            raise ValueError("%s is an invalid Urn type" %urn_type)
+        self.probability = 1/float(self.maxtype)
+
+        self.initial_energy = initial_energy
+        self.costs = dict(energy_costs)
+
+        n, T = count_cells, count_product_types
+        self.rules = numpy.zeros((n, T, T), dtype=numpy.int64)
+        self.rules_in = numpy.zeros((n, T), dtype=numpy.int64)
+        self.cell_rules = numpy.zeros(n, dtype=numpy.int64)
+        self.energy = numpy.zeros((n, T, CAPACITY))
+        self.size = numpy.zeros((n, T), dtype=numpy.int64)
+        self.urn = numpy.zeros(T, dtype=numpy.int64)
+        self.positions = numpy.zeros((n, 2), dtype=numpy.int64)
+        self.neighbors = numpy.zeros((n, n), dtype=bool)
+        self.alive = numpy.ones(n, dtype=bool)
+        self.active_rule = numpy.zeros((n, 2), dtype=numpy.int64)
+
+        if self.urn_type == 3:
+            self.urn[:] = int(count_products/float(T))
+        elif self.urn_type == 4:
+            self.urn[0] = count_products
+
+
+    @classmethod
+    def from_space(cls, space):
+        """ Copies the state of an object-model run (a Space and its cells
+        and urn) into a new ArrayModel that shares the Space's RNG.
+        """
+
+        cells = space.cell_index.cells
+        first = cells[0]
+        urn = first.urn
+        types = ["", "fixed-rich", "fixed-poor", "endo-rich", "endo-poor"]
+
+        model = cls(len(cells), urn.maxtype, space.RNG, types[urn.type],
+            space.energy_costs, urn.initial_energy, urn.count_products,
+            first.intel, first.repro_type, first.topology, space.radius,
+            (space.max_x, space.max_y))
+        model.master_count = space.master_count
+        model.last_added_rule = space.last_added_rule
+
+        position = {}
+        for c, cell in enumerate(cells):
+            position[cell] = c
+
+        for c, cell in enumerate(cells):
+            model.rules[c] = numpy.array(cell.rule_counts)[1:,1:]
+            model.alive[c] = cell.isAlive
+            model.positions[c] = cell.get_location()
+            for ngh in cell.neighbors:
+                model.neighbors[c, position[ngh]] = True
+            if cell.active_rule != None:
+                model.active_rule[c] = (cell.active_rule.get_input()-1,
+                    cell.active_rule.get_output()-1)
+            if cell.isAlive:
+                for t, products in cell.products.items():
+                    for product in products:
+                        model.store(c, t-1, product.get_energy())
+
+        model.rules_in[:] = model.rules.sum(axis=2)
+        model.cell_rules[:] = model.rules_in.sum(axis=1)
+
+        if urn.type == 3 or urn.type == 4:
+            for t in range(urn.maxtype):
+                model.urn[t] = urn.get_count(t+1)
+
+        return model
+
+
+    @property
+    def products(self):
+        """ Stored products per cell and type (cells x types).
+        """
+
+        return self.size.copy()
+
+
+    def snapshot(self):
+        """ A copy of the whole state as a dictionary of arrays.
+        """
+
+        return {"rules": self.rules.copy(),
+            "energy": self.energy.copy(),
+            "size": self.size.copy(),
+            "urn": self.urn.copy(),
+            "positions": self.positions.copy(),
+            "neighbors": self.neighbors.copy(),
+            "alive": self.alive.copy(),
+            "active_rule": self.active_rule.copy(),
+            "counts": numpy.array([self.master_count, self.last_added_rule])}
+
+
+    def save(self, filename):
+        """ Writes snapshot() to an .npz file.
+        """
+
+        numpy.savez_compressed(filename, **self.snapshot())
+
+
+    def add_rule(self, c, i, o):
+        self.rules[c, i, o] += 1
+        self.rules_in[c, i] += 1
+        self.cell_rules[c] += 1
+
+
+    def remove_rule(self, c, i, o):
+        """ Removes a rule and kills the cell if it was the last one. A dead
+        cell's stored products go back into the urn.
+        """
+
+        if self.rules[c, i, o] <= 0:
+            raise ValueError("This rule doesn't belong to this cell")
+        self.rules[c, i, o] -= 1
+        self.rules_in[c, i] -= 1
+        self.cell_rules[c] -= 1
+
+        if self.cell_rules[c] <= 0:
+            if self.urn_type == 3 or self.urn_type == 4:
+                self.urn += self.size[c]
+            self.size[c] = 0
+            self.alive[c] = False
+
+
+    def get_random_cell(self):
+        """ A cell, weighted by the number of rules it has.
+        """
+
+        total = self.cell_rules.sum()
+        if total <= 0:
+            raise ValueError("sample larger than population")
+        r = int(self.RNG.random() * total)
+        return int(numpy.searchsorted(numpy.cumsum(self.cell_rules), r,
+            side="right"))
+
+
+    def get_random_rule(self, c):
+        """ A rule of cell C as (input, output), weighted by the counts.
+        """
+
+        total = self.cell_rules[c]
+        if total <= 0:
+            raise ValueError("sample larger than population")
+        r = int(self.RNG.random() * total)
+        index = int(numpy.searchsorted(numpy.cumsum(self.rules[c]), r,
+            side="right"))
+        return divmod(index, self.maxtype)
+
+
+    def get_random_rule_of_type(self, c, i):
+        """ A rule of cell C that takes input I, weighted by the counts.
+        """
+
+        total = self.rules_in[c, i]
+        if total <= 0:
+            raise ValueError("sample larger than population")
+        r = int(self.RNG.random() * total)
+        o = int(numpy.searchsorted(numpy.cumsum(self.rules[c, i]), r,
+            side="right"))
+        return i, o
+
+
+    def get_neighbor(self, c):
+        """ A neighbor of cell C uniform-at-random, or -1 if it has none.
+        """
+
+        nghs = numpy.flatnonzero(self.neighbors[c])
+        if len(nghs) == 0:
+            return -1
+        return int(nghs[int(self.RNG.random() * len(nghs))])
+
+
+    def update_neighbors(self, c):
+        """ Recomputes cell C's neighbors from the torus distances to every
+        cell. The cell counts as its own neighbor, as in AC_Space.
+        """
+
+        dx = numpy.abs(self.positions[:, 0] - self.positions[c, 0])
+        dy = numpy.abs(self.positions[:, 1] - self.positions[c, 1])
+        dx = numpy.minimum(dx, self.max_x - dx)
+        dy = numpy.minimum(dy, self.max_y - dy)
+        within = dx**2 + dy**2 <= self.radius**2
+        self.neighbors[c, :] = within
+        self.neighbors[:, c] = within
+
+
+    def move_cell(self, c):
+        """ The same Brownian step as AC_Space.move_cell.
+        """
+
+        x_move = self.RNG.randint(-1,1)
+        y_move = self.RNG.randint(-1,1)
+        self.positions[c, 0] = (self.positions[c, 0] - 1 + x_move) % \
+            self.max_x + 1
+        self.positions[c, 1] = (self.positions[c, 1] - 1 + y_move) % \
+            self.max_y + 1
+        self.update_neighbors(c)
+
+
+    def request_product(self, i):
+        """ AC_Products.Urn.request_product() for input I. Returns the
+        product's energy or None if the request failed.
+        """
+
+        if self.selective:
+            if self.urn_type == 1:
+                return self.initial_energy
+            elif self.urn_type == 2:
+                if i == 0:
+                    return self.initial_energy
+                return None
+            else:
+                if self.urn[i] > 0:
+                    self.urn[i] -= 1
+                    return self.initial_energy
+                return None
+
+        else:
+            if self.urn_type == 1:
+                if self.RNG.random() <= self.probability:
+                    return self.initial_energy
+                return None
+            elif self.urn_type == 2:
+                if i == 0:
+                    return self.initial_energy
+                return None
+            elif self.urn_type == 3:
+                if self.RNG.randint(1, self.count_products) <= self.urn[i]:
+                    self.urn[i] -= 1
+                    return self.initial_energy
+                return None
+            else:
+                total = self.urn.sum()
+                if total <= 0:
+                    return None
+                r = int(self.RNG.random() * total)
+                if r >= self.urn[:i].sum() and r < self.urn[:i+1].sum():
+                    self.urn[i] -= 1
+                    return self.initial_energy
+                return None
+
+
+    def return_product(self, t):
+        """ Products only go back into endogenous urns, where they get their
+        energy back. Fixed urns just drop them.
+        """
+
+        if self.urn_type == 3 or self.urn_type == 4:
+            self.urn[t] += 1
+
+
+    def store(self, c, t, energy):
+        """ Puts a product of type T with ENERGY on top of cell C's stack,
+        making the stacks deeper if it is full.
+        """
+
+        k = self.size[c, t]
+        if k >= self.energy.shape[2]:
+            deeper = numpy.zeros(self.energy.shape[:2] +
+                (2 * self.energy.shape[2],))
+            deeper[:, :, :k] = self.energy
+            self.energy = deeper
+        self.energy[c, t, k] = energy
+        self.size[c, t] = k + 1
+
+
+    def take_stored(self, c, t):
+        """ Takes the product of type T that cell C stored last, as
+        AC_Cells.Cell.remove_Product() does. Returns its energy or None if
+        there is none.
+        """
+
+        k = self.size[c, t]
+        if k == 0:
+            return None
+        self.size[c, t] = k - 1
+        return self.energy[c, t, k - 1]
+
+
+    def activate_random_rule(self):
+        """ AC_Space.activate_random_rule().
+        """
+
+        c = self.get_random_cell()
+        self.active_rule[c] = self.get_random_rule(c)
+        self.move_cell(c)
+        self.chain_step(c)
+
+
+    def chain_step(self, c):
+        """ AC_Cells.Cell.chain_step() for cell C.
+        """
+
+        self.master_count += 1
+        i, o = self.active_rule[c]
+
+        energy = self.take_stored(c, i)
+        if energy == None:
+            energy = self.request_product(i)
+
+        if energy != None and energy > 0:
+            if energy >= self.costs["transform"]:
+                energy -= self.costs["transform"]
+
+                if energy >= self.costs["pass"]:
+                    energy -= self.costs["pass"]
+                    if self.topology == "spatial":
+                        ngh = self.get_neighbor(c)
+                    else:
+                        ngh = -1
+
+                    if ngh >= 0:
+                        self.receive_product(ngh, c, o, energy)
+                    else:
+                        self.store(c, o, energy)
+                else:
+                    self.return_product(o)
+            else:
+                self.return_product(i)
+
+
+    def receive_product(self, c, sender, t, energy):
+        """ AC_Cells.Cell.receive_product() for cell C.
+        """
+
+        self.master_count += 1
+
+        if self.rules_in[c, t] > 0 and energy > 0:
+            self.active_rule[c] = self.get_random_rule_of_type(c, t)
+
+            if energy >= self.costs["reproduce"]:
+                energy -= self.costs["reproduce"]
+
+                if self.repro_type == "target":
+                    self.reproduce_active_rule(c)
+                elif self.repro_type == "source":
+                    self.reproduce_active_rule(sender)
+
+                self.store(c, t, energy)
+            else:
+                self.return_product(t)
+        else:
+            self.return_product(t)
+
+
+    def reproduce_active_rule(self, c):
+        """ Copies the rule cell C just used and removes one at random.
+        """
+
+        i, o = self.active_rule[c]
+        self.add_rule(c, i, o)
+        self.last_added_rule = self.master_count
+        self.remove_random_rule()
+
+
+    def remove_random_rule(self):
+        """ The selection pressure: a rule is removed uniform-at-random.
+        """
+
+        c = self.get_random_cell()
+        i, o = self.get_random_rule(c)
+        self.remove_rule(c, i, o)
+
+
+    def run(self, steps):
+        """ Runs activations until the model has taken STEPS steps.
+        """
+
+        while self.master_count < steps:
+            self.activate_random_rule()
+
+        return self.master_count
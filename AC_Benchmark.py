@@ -0,0 +1,96 @@
+""" This module measures how much memory runs of the model take, which is what
+limits how many runs a sweep worker can hold at once. It builds RUNS headless
+runs side by side, runs each for STEPS steps and reports the growth of the
+process and, class by class, the objects the runs hold.
+
+    python AC_Benchmark.py [TYPES] [URN] [REPRO] [RUNS] [STEPS]
+
+
+Written by Jon Atwell
+"""
+
+import AC_Cells
+import AC_Headless
+import AC_ProductRules
+import AC_Products
+import gc
+import resource
+import sys
+
+
+CLASSES = [AC_Products.Product, AC_ProductRules.ProductRule,
+    AC_ProductRules.ProductNetRule, AC_Cells.Cell, AC_Cells.NeighborSet]
+
+
+def get_max_rss():
+    """ The peak resident size of this process in kilobytes.
+    """
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_instance_size(obj):
+    """ The bytes of an object itself, along with its __dict__ if it has
+    one. What the attributes point to isn't counted.
+    """
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def count_instances(classes=CLASSES):
+    """ For each of CLASSES, the number of live instances and the bytes
+    they take up.
+    """
+
+    counts = dict([(cls, [0, 0]) for cls in classes])
+    for obj in gc.get_objects():
+        # old-style instances all have the type 'instance'
+        cls = getattr(obj, "__class__", type(obj))
+        if cls in counts:
+            counts[cls][0] += 1
+            counts[cls][1] += get_instance_size(obj)
+    return counts
+
+
+def measure(TYPES=3, URN="endo-rich", REPRO="target", runs=10, steps=50000):
+    """ Builds and runs RUNS models and prints the memory they take.
+    """
+
+    gc.collect()
+    start = get_max_rss()
+
+    models = []
+    for i in range(runs):
+        model = AC_Headless.HeadlessModel(TYPES, URN, REPRO, seed=i,
+            verbose=False, live_rulenet=True)
+        model.run(steps)
+        models.append(model)
+
+    gc.collect()
+    end = get_max_rss()
+
+    print "%d runs of %s for %d steps" %(runs,
+        AC_Headless.get_name(TYPES, URN, REPRO), steps)
+    print "process grew by %d KB, %.1f KB per run" %(end - start,
+        (end - start) / float(runs))
+    for cls, (count, size) in sorted(count_instances().items(),
+        key=lambda item: item[0].__name__):
+        print "%-16s %8d objects %10d bytes %6.1f bytes each" %(cls.__name__,
+            count, size, size / float(max(count, 1)))
+
+    return models
+
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    TYPES = int(args[0]) if len(args) > 0 else 3
+    URN = args[1] if len(args) > 1 else "endo-rich"
+    REPRO = args[2] if len(args) > 2 else "target"
+    runs = int(args[3]) if len(args) > 3 else 10
+    steps = int(args[4]) if len(args) > 4 else 50000
+
+    measure(TYPES, URN, REPRO, runs, steps)
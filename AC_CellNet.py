@@ -10,23 +10,24 @@ Written by Jon Atwell
 import networkx
 import math
 import random
+import AC_CellIndex
 
 
-def measure_distance(cell1, cell2):
-    """ This function maps distances in a cartesian plane of size 10X10 to a
-    torus of the same size and then measures the Euclidean distance on
-    the torus.
+def measure_distance(cell1, cell2, dimensions=(10,10)):
+    """ This function maps distances in a cartesian plane of size DIMENSIONS
+    (10X10 by default) to a torus of the same size and then measures the
+    Euclidean distance on the torus.
     """
 
     x1, y1 = cell1.location
     x2, y2 = cell2.location
-    x_dist = abs(x1-x2)
-    y_dist = abs(y1-y2)
+    x_dist = abs(x1-x2) % dimensions[0]
+    y_dist = abs(y1-y2) % dimensions[1]
     
-    if x_dist > 5:
-        x_dist = 10-x_dist
-    if y_dist > 5:
-        y_dist = 10-y_dist
+    if x_dist > dimensions[0]/2.:
+        x_dist = dimensions[0]-x_dist
+    if y_dist > dimensions[1]/2.:
+        y_dist = dimensions[1]-y_dist
     
     return math.sqrt(x_dist**2 + y_dist**2)
 
@@ -37,7 +38,7 @@ class CellNet:
     between cells. Currently, it overlays geographic space in a grid.
     """
 
-    def __init__(self, cells, RNG, type="Moore"):
+    def __init__(self, cells, RNG, type="Moore", dimensions=(10,10)):
     
         self.net = networkx.Graph()
 
@@ -54,6 +55,7 @@ class CellNet:
         self.last_added_rule = 0
         self.rules = []
         self.debug = None
+        self.dimensions = dimensions
         
         # A kludgy way to allow the cells to call cellNet functions.
         for cl in cells:
@@ -61,6 +63,9 @@ class CellNet:
 
         self.distribute_onto_grid(cells, type)
 
+        # rule-weighted index for picking cells, kept current by the cells.
+        self.cell_index = AC_CellIndex.CellIndex(self.cells)
+
 
     def distribute_onto_grid(self, cells,type):
         """ A method to array the cell onto a grid so that we can have
@@ -69,12 +74,11 @@ class CellNet:
 
         # setting up the typology of the space the cells will be in
         if type == "Moore":
-            size = 10
             count=0
 
-            # moving them into a '10X10 grid'
-            for i in range(1,size+1):
-                for j in range(1, size+1):
+            # moving them into a grid ('10X10' by default)
+            for i in range(1,self.dimensions[0]+1):
+                for j in range(1, self.dimensions[1]+1):
                     cells[count].set_location(i,j)
                     count +=1
 
@@ -85,27 +89,26 @@ class CellNet:
                         one = cells[i]
                         two = cells[j]
                         # special function to wrap edges of the torus around.
-                        dist = measure_distance(one, two)
+                        dist = measure_distance(one, two, self.dimensions)
                         if dist < 1.5:
                             one.add_neighbor(two)
                             two.add_neighbor(one)
                             self.net.add_edge(one,two)
 
 
+    def update_rule_count(self, cell, delta, rule=None):
+        """ Called by a cell whenever it gains or loses rules so that the
+        cell index stays in step with the cells' rule counts."""
+
+        self.cell_index.add(cell, delta)
+
+
     def get_random_cell(self, who=None):
         """ A function to select a cell, weighted by the number
         of rules it has. The who argument is used to prevent self
         pass backs in the non-spatial variant."""
 
-        candidates = []
-        cnts = []
-        for i in self.cells:
-            if i != who:
-                cnts.append(i.count_rules)
-                for j in range(i.count_rules):
-                        candidates.append(i)
-
-        return self.RNG.sample(candidates, 1)[0]
+        return self.cell_index.get_random_cell(self.RNG, who)
 
 
     def activate_random_rule(self, debug=False):
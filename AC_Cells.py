@@ -10,7 +10,61 @@ Written by Jon Atwell
 import AC_ProductRules
 
 
-class Cell:
+class NeighborSet(object):
+    """ The collection of a cell's neighbors. It behaves like the list it
+    replaces (iteration, indexing, len, in) but membership, adding and
+    removing are O(1). A removed neighbor's place is taken by the last one,
+    so the order stays reproducible.
+    """
+
+    __slots__ = ("items", "places")
+
+    def __init__(self, cells=()):
+        self.items = []
+        self.places = {}
+        for cell in cells:
+            self.append(cell)
+
+    def append(self, cell):
+        if cell not in self.places:
+            self.places[cell] = len(self.items)
+            self.items.append(cell)
+
+    def extend(self, cells):
+        for cell in cells:
+            self.append(cell)
+
+    def remove(self, cell):
+        place = self.places.pop(cell)
+        last = self.items.pop()
+        if last is not cell:
+            self.items[place] = last
+            self.places[last] = place
+
+    def __contains__(self, cell):
+        return cell in self.places
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+
+class Cell(object):
+    """ A cell holds rules and products and acts on them. Its attributes are
+    fixed (see __slots__) to keep the many cells of many runs small.
+    """
+
+    __slots__ = ("isAlive", "scaling_x", "scaling_y", "border_size", "Sprite",
+        "location", "neighbors", "product_netrules", "products",
+        "count_rules", "active_rule", "id", "RNG", "repro_type", "intel",
+        "topology", "radius", "urn", "productRule_Net", "myspace",
+        "rule_counts", "input_counts", "rule_table")
 
     def __init__(self, urn, productRule_Net, RNG, id, Sprite, screen_dimensions, space_dimensions, border_size,
                     selective_intelligence=False, reproduction_type="source",
@@ -25,8 +79,7 @@ class Cell:
         self.border_size = border_size
         self.Sprite = Sprite
         self.location = (-1,-1)
-        self.neighbors = []               # added after locations are assigned
-        self.product_rules = {}
+        self.neighbors = NeighborSet()    # added after locations are assigned
         self.product_netrules = {}
         self.products = {}
         self.count_rules = 0
@@ -41,6 +94,14 @@ class Cell:
         self.productRule_Net = productRule_Net
         self.myspace = None         # we'll add this once the cells are made.
 
+        # Rules of a type are interchangeable, so the cell only counts them.
+        # rule_counts[input][output] is the number of rules of that type and
+        # input_counts[input] the number of rules taking that input.
+        types = urn.maxtype
+        self.rule_counts = [[0] * (types+1) for i in range(types+1)]
+        self.input_counts = [0] * (types+1)
+        self.rule_table = AC_ProductRules.get_rule_table(types)
+
 
     def __str__(self):
         """ Print checks for the version of the model with cell movement.
@@ -56,9 +117,12 @@ class Cell:
         """
         
         self.location = (x,y)
-        self.Sprite.x = (x-1) * self.scaling_x + self.border_size
-        self.Sprite.y = (y-1) * self.scaling_y + self.border_size
-        self.Sprite.color = (150,int(self.count_rules*255/200.),150)
+
+        # Headless runs have no Sprite, so there is nothing to draw.
+        if self.Sprite is not None:
+            self.Sprite.x = (x-1) * self.scaling_x + self.border_size
+            self.Sprite.y = (y-1) * self.scaling_y + self.border_size
+            self.Sprite.color = (150,int(self.count_rules*255/200.),150)
         
 
     def get_location(self):
@@ -107,7 +171,7 @@ class Cell:
         """ 
         has = []
         for content in self.products.keys():
-            if content in self.product_rules.keys():
+            if self.input_counts[content] > 0:
                 has.extend(self.products[content])
             else:
                 self.products[content] = []
@@ -124,46 +188,47 @@ class Cell:
         its type.
         """
 
-        if type(product) == int:
-            if product in self.product_rules.keys(): 
-                #indexError if no rules for that type
-                return True
-            else:
-                return False
-        else:
-            if product.get_type() in self.product_rules.keys(): 
-                #indexError if no rules for that type
-                return True
-            else:
-                return False
+        if type(product) != int:
+            product = product.get_type()
+
+        return self.input_counts[product] > 0
+
+
+    def get_rule_types(self):
+        """ A list of (input, output, count) for every type of rule the cell
+        holds.
+        """
+
+        types = []
+        for input, outputs in enumerate(self.rule_counts):
+            for output, count in enumerate(outputs):
+                if count > 0:
+                    types.append((input, output, count))
+        return types
 
 
     def add_ProductRule(self, aProductRule):
         """ The method for adding a product rule to the collection the cell
-        currently owns.
+        currently owns. Only the count for the rule's type is kept.
         """
         
         # making sure nothing inappropriate sneaks in.
         if isinstance(aProductRule, AC_ProductRules.ProductRule):
 
-            # Because we're using dictionaries to hold everything,
-            # a nested set of try/except expressions  is used to set the
-            # dictionaries up correctly. Possibly rewrite using Collections
-            # module dictionaries.
-
             input = aProductRule.get_input()
             output = aProductRule.get_output()
-            try:
-                self.product_rules[input][output].append(aProductRule)
-            except:
-                try:
-                    self.product_rules[input][output] = [aProductRule]
-                except:
-                    self.product_rules[input] = {}
-                    self.product_rules[input][output] = [aProductRule]
-
+            self.rule_counts[input][output] += 1
+            self.input_counts[input] += 1
             self.count_rules +=1
 
+            # The space keeps a rule-weighted index of the cells.
+            if self.myspace != None:
+                self.myspace.update_rule_count(self, 1, aProductRule)
+
+            # A live rule net follows every rule as it comes and goes.
+            if self.productRule_Net.live:
+                self.add_ProductNetRule(aProductRule)
+
         else:
             raise TypeError("Argument is not of type AC_Products.ProductRule")
             
@@ -177,27 +242,25 @@ class Cell:
         in_put = a_ProductRule.get_input()
         output = a_ProductRule.get_output()
 
-        # This pulls the actual instance out of the cell's collection
-        self.product_rules[in_put][output].remove(a_ProductRule)
+        if self.rule_counts[in_put][output] <= 0:
+            raise ValueError("This rule doesn't belong to this cell")
+
+        self.rule_counts[in_put][output] -= 1
+        self.input_counts[in_put] -= 1
 
         # This count just saves us from having to count the collection
         self.count_rules -= 1
-
-        # Doing some clean up: If that was the last of that type of rule...
-        if self.product_rules[in_put][output] == []:
-
-            # We also remove that key from the outer dictionary
-            # in the rules collection. pop() on a dict removes the key.
-            self.product_rules[in_put].pop(output)
-
-            # If the outer dict. is also empty, we remove it as well.
-            if self.product_rules[in_put] == {}:
-                self.product_rules.pop(in_put)
+        if self.myspace != None:
+            self.myspace.update_rule_count(self, -1, a_ProductRule)
+        if self.productRule_Net.live:
+            self.remove_ProductNetRule(a_ProductRule)
 
         if self.count_rules <=0:
             for vals in self.products.values():
                 for pro in vals:
                     self.urn.return_product(pro)
+            # the urn reuses returned products, so none can stay here
+            self.products = {}
 
             self.isAlive = False
              
@@ -211,7 +274,7 @@ class Cell:
         # A check to make sure nothing that shouldn't be in here slips in.
         if isinstance(a_ProductRule, AC_ProductRules.ProductRule):
             try:
-                self.product_netrules[a_ProductRule.get_name()].add_to_count()
+                self.product_netrules[a_ProductRule.key].add_to_count()
             except:
                 # If there isn't a netrule yet, we need to create one.
                 # This code is only run during model initialization.
@@ -222,20 +285,52 @@ class Cell:
                 new.set_owner(self)
 
                 # we add the netrule to the cell's collection.
-                self.product_netrules[a_ProductRule.get_name()] = new
+                self.product_netrules[a_ProductRule.key] = new
 
                 #We also add it to the product rule net.
                 self.productRule_Net.add_ProductNetRule(new)
+
+                # A live net also needs the edges to the neighbors' rules.
+                if self.productRule_Net.live:
+                    self.productRule_Net.connect_rule(new, self.neighbors)
         
         else:
             raise TypeError("Argument is not of type AC_Products.ProductRule")
+
+
+    def remove_ProductNetRule(self, a_ProductRule):
+        """ The counterpart of add_ProductNetRule(). When the last rule of a
+        type is gone, its NetRule leaves the cell and the productRule_Net.
+        """
+
+        name = a_ProductRule.key
+        netrule = self.product_netrules[name]
+        netrule.subtract_from_count()
+
+        if netrule.get_count() <= 0:
+            self.product_netrules.pop(name)
+            self.productRule_Net.remove_ProductNetRule(netrule,
+                self.myspace.master_count)
+
+
+    def sync_ProductNetRules(self):
+        """ Replaces the cell's NetRules with fresh ones, one for every type
+        of rule it holds and counting how many of that type it has.
+        """
+
+        self.product_netrules = {}
+        for input, output, count in self.get_rule_types():
+            new = AC_ProductRules.ProductNetRule(input, output, count)
+            new.set_owner(self)
+            self.product_netrules[(input, output)] = new
+            self.productRule_Net.add_ProductNetRule(new)
             
             
     def set_active_rule(self, rule):
         """ A simple method to set the currently active rule in the cell.
         """
 
-        if rule in self.product_rules[rule.get_input()][rule.get_output()]:
+        if self.rule_counts[rule.get_input()][rule.get_output()] > 0:
             self.active_rule = rule 
         else:
             raise InstanceError("This rule doesn't belong to this cell")
@@ -244,10 +339,7 @@ class Cell:
     def reproduce_active_rule(self):
         """ This takes the rule the cell just used and reproduces it.
         """
-        r = self.active_rule
-
-        self.add_ProductRule((AC_ProductRules.ProductRule(r.get_input(),
-            r.get_output())))
+        self.add_ProductRule(self.active_rule)
         self.myspace.last_added_rule = self.myspace.master_count
 
         # This is just part of the deal.
@@ -262,7 +354,7 @@ class Cell:
         input in the urn, it transforms it and passes it onto a neighbor.
         """
         self.myspace.master_count +=1
-        if  self.myspace.master_count % 10000 == 0:
+        if  self.myspace.master_count % 10000 == 0 and self.myspace.verbose:
             print "steps: ", self.myspace.master_count
         
         # now we have a rule and we need to try to get a product it can use
@@ -315,7 +407,7 @@ class Cell:
         """
 
         self.myspace.master_count +=1
-        if  self.myspace.master_count % 10000 == 0:
+        if  self.myspace.master_count % 10000 == 0 and self.myspace.verbose:
             print "steps: ", self.myspace.master_count
 
         start = product.get_type()
@@ -361,14 +453,19 @@ class Cell:
         because there can be more than one instance of an actual rule of each
         net rule type.
         """   
-        candidates = []
 
-        for input in self.product_rules.keys():
-            for output in self.product_rules[input].keys():
-                for rule in self.product_rules[input][output]:
-                    candidates.append(rule)
+        if self.count_rules <= 0:
+            raise ValueError("sample larger than population")
 
-        return self.RNG.sample(candidates,1)[0]
+        # walking the counts in order, like a list of every rule would be.
+        r = int(self.RNG.random() * self.count_rules)
+        for input, in_count in enumerate(self.input_counts):
+            if r < in_count:
+                for output, count in enumerate(self.rule_counts[input]):
+                    if r < count:
+                        return self.rule_table[input][output]
+                    r -= count
+            r -= in_count
 
     
     def get_random_rule_of_type(self,type):
@@ -379,18 +476,19 @@ class Cell:
         can be more than one instance of an actual rule of each net rule type.
         """ 
 
-        candidates = []
+        if self.input_counts[type] <= 0:
+            raise ValueError("sample larger than population")
 
-        for output in self.product_rules[type].keys():
-            for rule in self.product_rules[type][output]:
-                    candidates.append(rule)
-
-        return self.RNG.sample(candidates,1)[0]
+        r = int(self.RNG.random() * self.input_counts[type])
+        for output, count in enumerate(self.rule_counts[type]):
+            if r < count:
+                return self.rule_table[type][output]
+            r -= count
 
     def get_neighbor(self):
-        try:
-            return self.RNG.sample(self.neighbors,1)[0]
-        except:
+        count = len(self.neighbors)
+        if count == 0:
             return None
+        return self.neighbors[int(self.RNG.random() * count)]
 
             
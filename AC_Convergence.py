@@ -0,0 +1,120 @@
+""" This module decides when a run has gone on long enough. get_step_count()
+gives every configuration a fixed length, long enough for the slowest runs,
+so runs that settle early keep going for nothing. A ConvergenceMonitor looks
+at the run every EVERY steps and calls it converged when either
+
+    - no rule has been reproduced for QUIET of the step budget, or
+    - over the last WINDOW checks, the entropy of the rule types (and the
+      number of cycles, if the rule net is live) have stopped drifting: the
+      older and newer halves of the window agree to within TOLERANCE and
+      to within their own noise.
+
+get_step_count() stays the upper bound; the monitor can only end runs
+sooner.
+
+
+Written by Jon Atwell
+"""
+
+import math
+
+
+def get_type_entropy(type_counts):
+    """ The entropy (in nats) of the distribution of rules over types, from
+    a table of counts like Space.type_counts.
+    """
+
+    counts = [count for row in type_counts for count in row if count > 0]
+    total = float(sum(counts))
+    if total == 0:
+        return 0.
+    return -sum([count/total * math.log(count/total) for count in counts])
+
+
+class ConvergenceMonitor:
+    """ Watches a run and says when its statistics have become stationary.
+    """
+
+    def __init__(self, space, rulenet, budget, every=10000, window=10,
+        tolerance=.02, quiet=.1, min_steps=0):
+        self.space = space
+        self.rulenet = rulenet
+        self.budget = budget
+        self.every = every
+        self.window = window
+        self.tolerance = tolerance
+        self.quiet = quiet
+        self.min_steps = min_steps
+        self.next_check = (space.master_count // every + 1) * every
+        self.entropies = []
+        self.cycles = []
+        self.converged = False
+        self.converged_at = None
+
+
+    def get_cycle_count(self):
+        """ The number of cycles in the rule net, or None if the net isn't
+        kept live (building it every check would cost more than it saves).
+        """
+
+        if not self.rulenet.live:
+            return None
+        if self.rulenet.counting:
+            return sum(self.rulenet.count_cycles(
+                self.rulenet.max_length).values())
+        return len(self.rulenet.get_cycles())
+
+
+    def is_stationary(self, values):
+        """ Whether the last WINDOW VALUES show no drift: the means of the
+        older and newer halves of the window differ by no more than
+        TOLERANCE (relative to their size) and no more than their own
+        noise. Noise alone isn't enough, as a noisy series can hide a
+        drift as large as the noise.
+        """
+
+        if len(values) < self.window:
+            return False
+        half = self.window // 2
+        older = values[-self.window:-half]
+        newer = values[-half:]
+
+        means = []
+        noise = 0.
+        for part in [older, newer]:
+            mean = sum(part) / float(len(part))
+            variance = sum([(value - mean)**2 for value in part]) / \
+                max(len(part) - 1, 1)
+            means.append(mean)
+            noise += variance / len(part)
+
+        scale = max(1., abs(means[0]), abs(means[1]))
+        difference = abs(means[1] - means[0])
+        return difference <= self.tolerance * scale and \
+            difference <= 2 * math.sqrt(noise)
+
+
+    def check(self):
+        """ Takes the run's statistics and decides whether it has converged.
+        """
+
+        space = self.space
+        self.next_check = (space.master_count // self.every + 1) * self.every
+
+        self.entropies.append(get_type_entropy(space.type_counts))
+        cycles = self.get_cycle_count()
+        if cycles != None:
+            self.cycles.append(cycles)
+
+        if space.master_count < self.min_steps:
+            return False
+
+        quiet = space.master_count - space.last_added_rule >= \
+            self.quiet * self.budget
+        stationary = self.is_stationary(self.entropies) and (cycles == None
+            or self.is_stationary(self.cycles))
+
+        if quiet or stationary:
+            self.converged = True
+            self.converged_at = space.master_count
+        return self.converged
@@ -0,0 +1,147 @@
+""" This module checks that the batched steps of AC_Kernel give the same runs
+as the object model. Every urn and reproduction type is run for STEPS steps
+from SEEDS seeds three ways: with HeadlessModel.run(), with the kernel in
+Python and, if Numba is installed, with the compiled kernel. It reports how
+many runs of the kernel end in exactly the state of the reference run
+(rules, products, locations, neighbors, urn and random number generator)
+and the means over the seeds of a few statistics of the runs.
+
+    python AC_Equivalence.py [SEEDS] [STEPS] [TYPES]
+
+
+Written by Jon Atwell
+"""
+
+import AC_Convergence
+import AC_Headless
+import AC_Kernel
+import sys
+import time
+
+
+CONFIGURATIONS = [("fixed-rich", "target"), ("fixed-rich", "source"),
+    ("fixed-poor", "target"), ("fixed-poor", "source"),
+    ("endo-rich", "target"), ("endo-rich", "source"),
+    ("endo-poor", "target"), ("endo-poor", "source")]
+WAYS = ["objects", "python", "compiled"]
+STATISTICS = ["alive", "rules", "types", "entropy", "stored", "urn",
+    "last added"]
+
+
+def run_model(way, TYPES, URN, REPRO, seed, steps):
+    """ A run of STEPS steps taken the WAY given, and how long the steps
+    took.
+    """
+
+    model = AC_Headless.HeadlessModel(TYPES, URN, REPRO, seed, verbose=False)
+    start = time.time()
+    if way == "objects":
+        model.run(steps)
+    else:
+        model.warm_up(steps, compiled=(way == "compiled"))
+    return model, time.time() - start
+
+
+def get_state(model):
+    """ Everything about the run that the next step depends on.
+    """
+
+    space = model.space
+    position = space.cell_index.positions
+    cells = []
+    for cell in space.index_cells:
+        active = None
+        if cell.active_rule != None:
+            active = cell.active_rule.key
+        products = [(t, [p.get_energy() for p in stored]) for t, stored in
+            sorted(cell.products.items()) if stored != []]
+        cells.append((cell.rule_counts, cell.isAlive, cell.location, active,
+            [position[ngh] for ngh in cell.neighbors], products))
+    return (space.master_count, space.last_added_rule, space.absorbed,
+        model.urn.counts, cells, model.RNG.getstate())
+
+
+def get_statistics(model):
+    """ The values of STATISTICS for the run.
+    """
+
+    space = model.space
+    cells = space.index_cells
+    types = 0
+    for row in space.type_counts:
+        types += len([count for count in row if count > 0])
+    stored = 0
+    for cell in cells:
+        stored += sum([len(products) for products in cell.products.values()])
+    return [sum([cell.isAlive for cell in cells]),
+        sum([cell.count_rules for cell in cells]), types,
+        AC_Convergence.get_type_entropy(space.type_counts), stored,
+        model.urn.total, space.last_added_rule]
+
+
+def compare(TYPES, URN, REPRO, seeds=10, steps=50000):
+    """ Runs one configuration every way and prints what came out. Returns
+    the number of kernel runs that didn't match their reference run.
+    """
+
+    ways = WAYS
+    if AC_Kernel.numba == None:
+        ways = WAYS[:2]
+
+    print "%s, %d seeds of %d steps" %(AC_Headless.get_name(TYPES, URN,
+        REPRO), seeds, steps)
+    print "%-10s" %"" + "".join(["%11s" %name for name in STATISTICS])
+
+    mismatches = 0
+    references = []
+    for way in ways:
+        means = [0.] * len(STATISTICS)
+        same = 0
+        seconds = 0.
+        for seed in range(seeds):
+            model, taken = run_model(way, TYPES, URN, REPRO, seed, steps)
+            seconds += taken
+            state = get_state(model)
+            if way == "objects":
+                references.append(state)
+            elif state == references[seed]:
+                same += 1
+            for i, value in enumerate(get_statistics(model)):
+                means[i] += value / float(seeds)
+
+        line = "%-10s" %way + "".join(["%11.2f" %mean for mean in means])
+        line += "   %.3f s a run" %(seconds / seeds)
+        if way != "objects":
+            line += ", %d/%d the same" %(same, seeds)
+            mismatches += seeds - same
+        print line
+
+    return mismatches
+
+
+def check(seeds=10, steps=50000, TYPES=3):
+    """ compare() for every configuration. Returns the total number of
+    mismatches.
+    """
+
+    if AC_Kernel.numba == None:
+        print "Numba isn't installed, so the compiled kernel is left out"
+
+    mismatches = 0
+    for URN, REPRO in CONFIGURATIONS:
+        mismatches += compare(TYPES, URN, REPRO, seeds, steps)
+        print
+
+    print "%d mismatched runs" %mismatches
+    return mismatches
+
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    seeds = int(args[0]) if len(args) > 0 else 10
+    steps = int(args[1]) if len(args) > 1 else 50000
+    TYPES = int(args[2]) if len(args) > 2 else 3
+
+    if check(seeds, steps, TYPES) > 0:
+        sys.exit(1)
@@ -0,0 +1,440 @@
+""" This is a model initializer and driver that works without any of the
+pyglet machinery. It builds the Urn, RuleSet, Cells and Space exactly as
+AC_model does, but the cells get no Sprites, so a step is nothing more than
+the chemistry. It is meant for long runs on machines without a display.
+
+
+Written by Jon Atwell
+"""
+
+import AC_Products
+import AC_ProductRules
+import AC_ProductRuleNet
+import AC_Cells
+import AC_Convergence
+import AC_Kernel
+import AC_Space
+import AC_grapher
+import AC_Sampler
+import AC_Random
+import cPickle
+import os
+import random
+import sys
+
+
+# Pickling follows the links between cells, rules and the networkx graphs
+# one level of recursion at a time, which goes deeper than the default.
+RECURSION_LIMIT = 100000
+
+
+def get_step_count(PRODUCT_TYPES):
+    """A utility function to determine how long to run the model. With an
+    adaptive run (see AC_Convergence) this is the most it will run.
+    """
+
+    STEPS = 270000
+
+    if PRODUCT_TYPES == 3:
+        STEPS = 410000
+    elif PRODUCT_TYPES == 4:
+        STEPS = 580000
+    elif PRODUCT_TYPES == 5:
+        STEPS = 770000
+    elif PRODUCT_TYPES == 6:
+        STEPS = 980000
+    elif PRODUCT_TYPES == 7:
+        STEPS = 1210000
+    elif PRODUCT_TYPES == 8:
+        STEPS = 1460000
+    elif PRODUCT_TYPES == 9:
+        STEPS = 1720000
+
+    return STEPS
+
+
+def load_checkpoint(filename, seed=None):
+    """ The HeadlessModel saved to FILENAME by HeadlessModel.save(). Its run
+    continues exactly where it stopped. With SEED the random numbers are
+    reseeded, so several different runs can be forked from the same state.
+    """
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        checkpoint = open(filename, "rb")
+        model = cPickle.load(checkpoint)
+        checkpoint.close()
+    finally:
+        sys.setrecursionlimit(limit)
+
+    if seed != None:
+        model.reseed(seed)
+    return model
+
+
+def get_name(TYPES, URN, REPRO, CHEM="ALL", INTEL=False, TOPO="spatial"):
+    """ The file name stem used for a configuration, e.g.
+    2-ALL-False-endo-rich-source-spatial. plotter.py expects these.
+    """
+
+    return "-".join([str(TYPES), CHEM, str(INTEL), URN + "-" + REPRO, TOPO])
+
+
+class HeadlessModel:
+    """ Everything needed for a single run of the model. The cells are
+    built without Sprites unless a sprite_factory is handed in, which is
+    how the visual version in AC_model reuses this setup.
+    """
+
+    def __init__(self, TYPES, URN, REPRO, seed=None, CHEM="ALL",
+        INTEL=False, TOPO="spatial", cell_count=20, product_count=200,
+        rule_count=200, energy_costs=None, initial_energy=10, radius=1.5,
+        cell_radius=.005, dimensions=(10,10), screen_dimensions=(700,700),
+        sprite_factory=None, cycle_counting=False, max_cycle_length=None,
+        live_rulenet=False, verbose=True, sample_every=None,
+        sample_file=None, motion="Brownian", move_every=None,
+        rng_streams=False, rng_block=None, stop_on=("frozen",),
+        adaptive=False, check_every=10000, tolerance=.02):
+
+        if energy_costs == None:
+            energy_costs = {"pass":1/3., "transform":1/3., "reproduce": 1/3.}
+        if seed == None:
+            seed = random.randint(0, sys.maxint)
+
+        self.TYPES = TYPES
+        self.URN = URN
+        self.REPRO = REPRO
+        self.CHEM = CHEM
+        self.INTEL = INTEL
+        self.TOPO = TOPO
+        self.seed = seed
+        self.steps = get_step_count(TYPES)
+
+        # counting mode streams cycles instead of listing them; for big nets.
+        self.cycle_counting = cycle_counting
+        self.max_cycle_length = max_cycle_length
+
+        # as rng to reproduce runs if desired. With RNG_STREAMS the rules,
+        # the urn, the cells and the space each get their own stream (see
+        # AC_Random), drawn in blocks of RNG_BLOCK if it is given.
+        self.streams = None
+        if rng_streams:
+            self.streams = AC_Random.Streams(seed, rng_block)
+            rules_RNG = self.streams.get("rules")
+            urn_RNG = self.streams.get("urn")
+            cells_RNG = self.streams.get("cells")
+            self.RNG = self.streams.get("space")
+        elif rng_block:
+            self.RNG = AC_Random.BlockRandom(seed, rng_block)
+            rules_RNG = urn_RNG = cells_RNG = self.RNG
+        else:
+            self.RNG = random.Random(seed)
+            rules_RNG = urn_RNG = cells_RNG = self.RNG
+
+        border_size = int(screen_dimensions[0] / float(dimensions[0]*1.1))
+
+        #Setting up the environment including the products
+        self.urn = AC_Products.Urn(URN+"-"+REPRO, TYPES, urn_RNG,
+            initial_energy, product_count)
+
+        # Creating all of the rules
+        rules = AC_ProductRules.create_RuleSet(CHEM, TYPES, rule_count,
+            rules_RNG)
+
+        #Creating a network object for compatible rules
+        self.rulenet = AC_ProductRuleNet.ProductRuleNet(
+            counting=cycle_counting, max_length=max_cycle_length)
+
+        self.cells = []
+        for i in range(cell_count):
+            if sprite_factory != None:
+                sprite = sprite_factory(i)
+            else:
+                sprite = None
+            new_cell = AC_Cells.Cell(self.urn, self.rulenet, cells_RNG, i+1,
+                sprite, screen_dimensions, dimensions, border_size, INTEL,
+                REPRO, TOPO, radius)
+            self.cells.append(new_cell)
+
+        #passing out the rules to cells at random
+        for i in range(len(rules)):
+            cell = rules_RNG.choice(self.cells)
+            cell.add_ProductRule(rules.pop(0))
+
+        # Creating a network of neighbors on torus grid
+        self.space = AC_Space.Space(self.cells, cell_radius, self.RNG,
+            radius, energy_costs, dimensions=dimensions, motion=motion,
+            move_every=move_every)
+
+        # A live rule net is kept current through the run instead of being
+        # built at the end.
+        if live_rulenet:
+            self.rulenet.build(self.cells, live=True)
+
+        self.space.verbose = verbose
+
+        # The run stops early once it reaches one of the states in STOP_ON
+        # (see Space.get_absorbing_states()); by default only once nothing
+        # can change any more.
+        self.space.stop_on = tuple(stop_on)
+        self.space.check_absorbed()
+
+        # An adaptive run ends once its statistics stop changing, see
+        # AC_Convergence; get_step_count() is then only the upper bound.
+        self.monitor = None
+        if adaptive:
+            self.monitor = AC_Convergence.ConvergenceMonitor(self.space,
+                self.rulenet, self.steps, check_every, tolerance=tolerance)
+
+        # Samples of the run every SAMPLE_EVERY steps, see AC_Sampler.
+        self.sampler = None
+        if sample_every != None:
+            self.sampler = AC_Sampler.Sampler(self.space, self.urn,
+                sample_every, filename=sample_file)
+            self.space.add_sampler(self.sampler)
+
+
+    def run(self, steps=None, checkpoint_every=None, checkpoint_file=None,
+        kernel=False, compiled=True):
+        """ Runs activations until the space has taken STEPS steps. With no
+        argument it runs to the length given by get_step_count(). With
+        CHECKPOINT_EVERY the whole run is saved to CHECKPOINT_FILE each
+        time that many steps have gone by. An adaptive run stops as soon as
+        it has converged. With KERNEL the steps are taken by the batched
+        steps of AC_Kernel when the run allows it (see
+        AC_Kernel.get_unsupported()), compiled by Numba if COMPILED and
+        Numba is installed. The run comes out the same either way, but the
+        step count isn't printed as it goes.
+        """
+
+        if steps == None:
+            steps = self.steps
+
+        space = self.space
+        activate = space.activate_random_rule
+        monitor = self.monitor
+        batched = kernel and AC_Kernel.get_unsupported(space) == None
+        packed = None
+        while space.master_count < steps and space.absorbed == None:
+            # run up to the next checkpoint or convergence check, if any
+            stop = steps
+            if checkpoint_every != None:
+                next_checkpoint = (space.master_count // checkpoint_every +
+                    1) * checkpoint_every
+                stop = min(stop, next_checkpoint)
+            if monitor != None:
+                stop = min(stop, monitor.next_check)
+
+            if batched:
+                if packed == None:
+                    packed = AC_Kernel.Kernel(space, compiled=compiled)
+                packed.run(stop)
+                packed.sync_counts()
+            else:
+                while space.master_count < stop and space.absorbed == None:
+                    activate()
+
+            if checkpoint_every != None and \
+                space.master_count >= next_checkpoint:
+                # the checkpoint is of the objects, so the packed state
+                # goes back into them and is packed again after
+                if packed != None:
+                    packed.sync()
+                    packed = None
+                self.save(checkpoint_file)
+            if monitor != None and space.master_count >= monitor.next_check:
+                if monitor.check():
+                    break
+
+        if packed != None:
+            packed.sync()
+        if self.sampler != None:
+            self.sampler.flush()
+
+        return space.master_count
+
+
+    def warm_up(self, steps, compiled=True):
+        """ Runs the first STEPS steps with run(kernel=True).
+        """
+
+        return self.run(steps, kernel=True, compiled=compiled)
+
+
+    def save(self, filename):
+        """ Writes the whole run (cells, rules, urn, space, rule net, samples
+        and random number generators) to FILENAME. The file is written
+        beside it and then moved over it, so a run stopped while saving
+        still has its last checkpoint.
+        """
+
+        for cell in self.cells:
+            if cell.Sprite is not None:
+                raise ValueError("a run with Sprites can't be saved")
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            checkpoint = open(filename + ".tmp", "wb")
+            cPickle.dump(self, checkpoint, cPickle.HIGHEST_PROTOCOL)
+            checkpoint.close()
+            os.rename(filename + ".tmp", filename)
+        finally:
+            sys.setrecursionlimit(limit)
+
+
+    def reseed(self, seed):
+        """ Reseeds the run's random numbers from SEED, in place, so
+        everything that holds a generator keeps drawing from it.
+        """
+
+        self.seed = seed
+        if self.streams != None:
+            self.streams.seed = seed
+            for name, generator in self.streams.generators.items():
+                generator.seed(AC_Random.derive_seed(seed, name))
+        else:
+            self.RNG.seed(seed)
+        if self.space.motion_RNG is not None:
+            self.space.motion_RNG.seed(AC_Random.get_words(
+                AC_Random.derive_seed(seed, "motion")))
+
+
+    def build_rulenet(self):
+        """ The ProductRuleNet of the rules the cells currently hold. A live
+        net is already current; otherwise a fresh one is built.
+        """
+
+        if self.rulenet.live:
+            return self.rulenet
+
+        self.rulenet = AC_ProductRuleNet.ProductRuleNet(
+            counting=self.cycle_counting, max_length=self.max_cycle_length)
+        self.rulenet.build(self.cells)
+
+        return self.rulenet
+
+
+    def is_active(self):
+        """ Whether a rule was added in the last tenth of the run. Runs
+        that are not active are recorded as zeros. A run that stopped early
+        because it was absorbed is judged at the step it would have ended.
+        """
+
+        space = self.space
+        end = space.master_count
+        length = self.steps
+        # an absorbed run is judged as if it had gone the whole way, a
+        # converged one as if it had been meant to end where it did.
+        if space.absorbed != None:
+            end = max(end, self.steps)
+        elif self.is_converged():
+            length = end
+        return space.last_added_rule + length*.1 > end
+
+
+    def is_converged(self):
+        """ Whether an adaptive run stopped because it converged.
+        """
+
+        return self.monitor != None and self.monitor.converged
+
+
+    def get_results(self, count_run):
+        """ The results of the run as a dictionary. Like the lines of
+        print_data(), runs that are not active get empty results.
+        """
+
+        space = self.space
+        results = {"run": count_run, "seed": self.seed,
+            "active": self.is_active(), "cycle_counts": {},
+            "plus3cell": False, "plus3rule": False, "alive": 0,
+            "last_added_rule": space.last_added_rule,
+            "steps": space.master_count, "absorbed": space.absorbed}
+        if self.is_converged() and space.absorbed == None:
+            results["absorbed"] = "converged"
+
+        if results["active"]:
+            rulenet = self.build_rulenet()
+            rulenet.update_cycle_counts(space.master_count)
+
+            count_alive = 0
+            for cell in self.cells:
+                if cell.count_rules  > 0:
+                    count_alive += 1
+
+            results["cycle_counts"] = rulenet.cycle_counts
+            results["plus3cell"] = rulenet.get_plus3cell_complexity()
+            results["plus3rule"] = rulenet.get_plus3rule_complexity()
+            results["alive"] = count_alive
+
+        return results
+
+
+    def get_data(self, count_run, results=None):
+        """ The line print_data() writes for this run.
+        """
+
+        if results == None:
+            results = self.get_results(count_run)
+
+        if results["active"]:
+            return (str(count_run)+","+
+                str(results["cycle_counts"])+","+
+                str(results["plus3cell"])+","+
+                str(results["plus3rule"])+","+
+                str(results["alive"])+","+
+                str(results["last_added_rule"])+"\n")
+
+        else:
+            return (str(count_run)+","+
+                str(0)+","+
+                str(0)+","+
+                str(0)+","+
+                str(0)+","+str(results["last_added_rule"])+"\n")
+
+
+    def print_data(self, name, count_run, html=False):
+        """ Appends the run's line to NAME.csv and, if asked, writes the
+        HTML visualization of the rule network.
+        """
+
+        data = self.get_data(count_run)
+
+        output_file = open(name+".csv", "a+")
+        output_file.write(data)
+        output_file.close()
+
+        if html and self.is_active():
+            print "writing html"
+            for cell in self.space.cells:
+                x,y = cell.get_location()
+                cell.set_location(x*.5, y*.5)
+            # Creating an HTML file to visualize the network
+            AC_grapher.output_JSON(self.space, self.rulenet, name
+                +"-"+str(count_run)+ ".html")
+
+        return data
+
+
+
+if __name__ == "__main__":
+    # python AC_Headless.py TYPES URN REPRO [RUNS]
+    # e.g. python AC_Headless.py 2 endo-rich source 100
+
+    TYPES = int(sys.argv[1])
+    URN = sys.argv[2]
+    REPRO = sys.argv[3]
+    if len(sys.argv) > 4:
+        RUNS = int(sys.argv[4])
+    else:
+        RUNS = 1
+
+    name = get_name(TYPES, URN, REPRO)
+    print name
+
+    for count_run in range(RUNS):
+        model = HeadlessModel(TYPES, URN, REPRO)
+        model.run()
+        print model.print_data(name, count_run),
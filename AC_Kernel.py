@@ -0,0 +1,685 @@
+""" This module runs many steps of a run at once, for the stretch of a visual
+run that is done headless before the windows open. A step of the object
+model goes through the methods of the Space, the Cells, the Urn and the
+Products; here the whole population is packed into flat lists
+
+    rules[(c*S + i)*S + o]         rules of cell c taking i to o (S = types+1)
+    rules_in[c*S + i], cell_rules  their totals per input and per cell
+    energy[(c*S + t)*cap + k]      the stored products of cell c and type t,
+                                   size[c*S + t] of them, used last-in
+                                   first-out like the cells' lists
+    nbr[c*n + k], place[c*n + d]   each cell's neighbors in the order of its
+                                   NeighborSet, and where each one is in it
+    bucket[spot*n + k]             the cells at each spot of the grid
+
+and run_steps() takes the steps one after another in a single loop, with
+the random numbers drawn ahead in blocks by a DrawBuffer. Everything is
+done in the same order with the same numbers as in the object model, so a
+run comes out exactly the same as with HeadlessModel.run(); Kernel.sync()
+then writes the state back into the cells, the space and the urn.
+
+With Numba installed, a Kernel made with compiled=True runs a compiled copy
+of run_steps() over NumPy arrays instead of the lists. It is compiled the
+first time it is needed and cached on disk after that. Without Numba the
+steps are taken in Python; either way the run is the same.
+
+Not every run can be packed: see get_unsupported().
+
+
+Written by Jon Atwell
+"""
+
+import AC_Cells
+import AC_Random
+import numpy
+import random
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BLOCK = 65536       # random numbers drawn at a time
+MARGIN = 16         # a step never uses more than this many
+CAPACITY = 16       # stored products per cell and type to start with
+
+# what run_steps() stopped for
+DONE = 0
+DRAWS = 1
+STORAGE = 2
+EXTINCT = 3
+
+# the packed state, as it is handed to run_steps()
+INTEGERS = ["P", "rules", "rules_in", "cell_rules", "type_counts", "alive",
+    "size", "px", "py", "nbr", "nbr_count", "place", "bucket", "bucket_count",
+    "bucket_place", "delta_x", "delta_y", "delta_start", "changed", "act_i",
+    "act_o", "urn_counts", "counters"]
+FLOATS = ["F", "energy", "draws"]
+
+# run_steps() compiled by Numba, once made
+compiled_steps = []
+
+
+def get_unsupported(space):
+    """ Why the run of SPACE can't be run by a Kernel, or None if it can.
+    """
+
+    cells = space.index_cells
+    urn = cells[0].urn
+    if space.motion_RNG is not None:
+        return "synchronous motion"
+    if space.samplers:
+        return "samplers"
+    if cells[0].productRule_Net.live:
+        return "a live rule net"
+    for cell in cells:
+        if cell.topology != "spatial":
+            return "a non-spatial topology"
+        if cell.RNG is not space.RNG:
+            return "separate random streams"
+    if urn.RNG is not space.RNG:
+        return "separate random streams"
+    if not isinstance(space.RNG, random.Random):
+        return "an unknown random number generator"
+    return None
+
+
+def get_compiled_steps():
+    """ run_steps() compiled by Numba, or None if Numba isn't installed.
+    """
+
+    if numba is None:
+        return None
+    if compiled_steps == []:
+        compiled_steps.append(numba.njit(nogil=True, cache=True)(run_steps))
+    return compiled_steps[0]
+
+
+def add_neighbor(nbr, nbr_count, place, n, c, d):
+    """ NeighborSet.append() of cell D to cell C.
+    """
+
+    m = nbr_count[c]
+    nbr[c*n + m] = d
+    place[c*n + d] = m
+    nbr_count[c] = m + 1
+
+
+def run_steps(P, F, rules, rules_in, cell_rules, type_counts, alive, energy,
+    size, px, py, nbr, nbr_count, place, bucket, bucket_count, bucket_place,
+    delta_x, delta_y, delta_start, changed, act_i, act_o, urn, counters,
+    draws, k, steps):
+    """ Takes steps until COUNTERS[0] (the master count) reaches STEPS,
+    using DRAWS from K on. It stops early when the draws run low, when a
+    store of products is full or when a rule type dies out, and returns
+    the next K and what it stopped for. P holds the whole-number and F the
+    floating point parameters (see Kernel).
+    """
+
+    n = P[0]
+    S = P[1]
+    urn_type = P[2]
+    count_products = P[3]
+    selective = P[4]
+    target = P[5]
+    max_x = P[6]
+    max_y = P[7]
+    cap = P[8]
+    probability = F[0]
+    initial = F[1]
+    transform_cost = F[2]
+    pass_cost = F[3]
+    reproduce_cost = F[4]
+
+    master = counters[0]
+    last_added = counters[1]
+    total = counters[2]
+    urn_total = counters[3]
+    top = counters[4]
+    end = len(draws) - MARGIN
+    status = DONE
+
+    while master < steps:
+        if k > end:
+            status = DRAWS
+            break
+        if top >= cap:
+            status = STORAGE
+            break
+        extinct = 0
+
+        # Space.get_random_cell()
+        r = int(draws[k] * total)
+        k += 1
+        c = 0
+        while r >= cell_rules[c]:
+            r -= cell_rules[c]
+            c += 1
+
+        # Cell.get_random_rule()
+        r = int(draws[k] * cell_rules[c])
+        k += 1
+        i = 0
+        while r >= rules_in[c*S + i]:
+            r -= rules_in[c*S + i]
+            i += 1
+        base = (c*S + i)*S
+        o = 0
+        while r >= rules[base + o]:
+            r -= rules[base + o]
+            o += 1
+        act_i[c] = i
+        act_o[c] = o
+
+        # Space.move_cell() and update_grid()
+        x_move = -1 + int(draws[k] * 3)
+        y_move = -1 + int(draws[k+1] * 3)
+        k += 2
+        x = (px[c] - 1 + x_move) % max_x + 1
+        y = (py[c] - 1 + y_move) % max_y + 1
+        spot = bucket_place[c] // n
+        j = bucket_place[c] % n
+        m = bucket_count[spot] - 1
+        bucket_count[spot] = m
+        moved = bucket[spot*n + m]
+        bucket[spot*n + j] = moved
+        bucket_place[moved] = spot*n + j
+        spot = (y - 1)*max_x + (x - 1)
+        m = bucket_count[spot]
+        bucket[spot*n + m] = c
+        bucket_place[c] = spot*n + m
+        bucket_count[spot] = m + 1
+        px[c] = x
+        py[c] = y
+
+        move = (x_move + 1)*3 + (y_move + 1)
+        count_changed = 0
+        for which in range(2):
+            # the spots added by the move, then the ones removed
+            for q in range(delta_start[move*2 + which],
+                delta_start[move*2 + which + 1]):
+                spot = ((y - 1 + delta_y[q]) % max_y)*max_x + \
+                    (x - 1 + delta_x[q]) % max_x
+                for j in range(bucket_count[spot]):
+                    d = bucket[spot*n + j]
+                    if which == 0 and d != c and place[c*n + d] < 0 or \
+                        which == 1 and place[c*n + d] >= 0:
+                        # kept in the order of the cells
+                        m = count_changed
+                        while m > 0 and changed[m-1] > d:
+                            changed[m] = changed[m-1]
+                            m -= 1
+                        changed[m] = d
+                        count_changed += 1
+        for j in range(count_changed):
+            d = changed[j]
+            if place[c*n + d] >= 0:
+                # NeighborSet.remove(), from both sides: the last
+                # neighbor takes the removed one's place
+                for a, b in ((d, c), (c, d)):
+                    p = place[a*n + b]
+                    place[a*n + b] = -1
+                    m = nbr_count[a] - 1
+                    nbr_count[a] = m
+                    moved = nbr[a*n + m]
+                    if moved != b:
+                        nbr[a*n + p] = moved
+                        place[a*n + moved] = p
+            else:
+                # NeighborSet.append(), both ways
+                for a, b in ((c, d), (d, c)):
+                    m = nbr_count[a]
+                    nbr[a*n + m] = b
+                    place[a*n + b] = m
+                    nbr_count[a] = m + 1
+
+        # Cell.chain_step()
+        master += 1
+        s = c*S + i
+        have = 0
+        e = initial
+        if size[s] > 0:
+            size[s] -= 1
+            e = energy[s*cap + size[s]]
+            have = 1
+
+        # Urn.request_product()
+        elif selective:
+            if urn_type == 1:
+                have = 1
+            elif urn_type == 2:
+                if i == 1:
+                    have = 1
+            elif urn[i] > 0:
+                urn[i] -= 1
+                urn_total -= 1
+                have = 1
+        elif urn_type == 1:
+            if draws[k] <= probability:
+                have = 1
+            k += 1
+        elif urn_type == 2:
+            if i == 1:
+                have = 1
+        elif urn_type == 3:
+            if 1 + int(draws[k] * count_products) <= urn[i]:
+                urn[i] -= 1
+                urn_total -= 1
+                have = 1
+            k += 1
+        elif urn_total > 0:
+            r = int(draws[k] * urn_total)
+            k += 1
+            t = 1
+            while r >= urn[t]:
+                r -= urn[t]
+                t += 1
+            if t == i:
+                urn[i] -= 1
+                urn_total -= 1
+                have = 1
+
+        if have and e > 0:
+            if e >= transform_cost:
+                e -= transform_cost
+                if e >= pass_cost:
+                    e -= pass_cost
+                    if nbr_count[c] == 0:
+                        d = c
+                    else:
+                        d = nbr[c*n + int(draws[k] * nbr_count[c])]
+                        k += 1
+
+                        # Cell.receive_product()
+                        master += 1
+                        if rules_in[d*S + o] > 0 and e > 0:
+                            r = int(draws[k] * rules_in[d*S + o])
+                            k += 1
+                            base = (d*S + o)*S
+                            oo = 0
+                            while r >= rules[base + oo]:
+                                r -= rules[base + oo]
+                                oo += 1
+                            act_i[d] = o
+                            act_o[d] = oo
+
+                            if e >= reproduce_cost:
+                                e -= reproduce_cost
+
+                                # Cell.reproduce_active_rule()
+                                a = c
+                                if target:
+                                    a = d
+                                ai = act_i[a]
+                                ao = act_o[a]
+                                rules[(a*S + ai)*S + ao] += 1
+                                rules_in[a*S + ai] += 1
+                                cell_rules[a] += 1
+                                type_counts[ai*S + ao] += 1
+                                total += 1
+                                last_added = master
+
+                                # Space.remove_random_rule()
+                                r = int(draws[k] * total)
+                                k += 1
+                                a = 0
+                                while r >= cell_rules[a]:
+                                    r -= cell_rules[a]
+                                    a += 1
+                                r = int(draws[k] * cell_rules[a])
+                                k += 1
+                                ai = 0
+                                while r >= rules_in[a*S + ai]:
+                                    r -= rules_in[a*S + ai]
+                                    ai += 1
+                                base = (a*S + ai)*S
+                                ao = 0
+                                while r >= rules[base + ao]:
+                                    r -= rules[base + ao]
+                                    ao += 1
+                                rules[base + ao] -= 1
+                                rules_in[a*S + ai] -= 1
+                                cell_rules[a] -= 1
+                                type_counts[ai*S + ao] -= 1
+                                total -= 1
+                                if type_counts[ai*S + ao] == 0:
+                                    extinct = 1
+
+                                # the cell dies and its products go back
+                                if cell_rules[a] <= 0:
+                                    for t in range(S):
+                                        if urn_type >= 3:
+                                            urn[t] += size[a*S + t]
+                                            urn_total += size[a*S + t]
+                                        size[a*S + t] = 0
+                                    alive[a] = 0
+                            else:
+                                d = -1
+                        else:
+                            d = -1
+
+                    if d >= 0:
+                        s = d*S + o
+                        energy[s*cap + size[s]] = e
+                        size[s] += 1
+                        if size[s] > top:
+                            top = size[s]
+                    elif urn_type >= 3:
+                        urn[o] += 1
+                        urn_total += 1
+                elif urn_type >= 3:
+                    urn[o] += 1
+                    urn_total += 1
+            elif urn_type >= 3:
+                urn[i] += 1
+                urn_total += 1
+
+        if extinct:
+            status = EXTINCT
+            break
+
+    counters[0] = master
+    counters[1] = last_added
+    counters[2] = total
+    counters[3] = urn_total
+    counters[4] = top
+    return k, status
+
+
+
+class DrawBuffer:
+    """ The numbers a random.Random would give, drawn ahead from a NumPy
+    RandomState in the same state. NumPy's generator is the same Mersenne
+    Twister, so the numbers are the same ones. finish() moves the generator
+    on past exactly the numbers that were used.
+    """
+
+    def __init__(self, RNG):
+        self.RNG = RNG
+        self.state = numpy.random.RandomState()
+        self.state.set_state(AC_Random.get_numpy_state(RNG))
+        self.drawn = 0      # numbers handed out so far
+        self.marks = [(self.drawn, self.state.get_state())]
+
+
+    def take(self, count):
+        """ The next COUNT numbers, as an array.
+        """
+
+        # where the stream was before each of the last two blocks
+        self.marks = self.marks[-1:] + [(self.drawn, self.state.get_state())]
+        self.drawn += count
+        return self.state.random_sample(count)
+
+
+    def finish(self, used):
+        """ Sets the generator to where it would be after USED calls to
+        random().
+        """
+
+        for drawn, state in reversed(self.marks):
+            if drawn <= used:
+                break
+        self.state.set_state(state)
+        while drawn < used:
+            skip = min(used - drawn, BLOCK)
+            self.state.random_sample(skip)
+            drawn += skip
+
+        AC_Random.set_numpy_state(self.RNG, self.state.get_state())
+
+
+
+class Kernel:
+    """ The state of the run of a Space packed into flat lists, see the
+    module docstring. run() takes the steps and sync() puts the state back
+    into the objects. With COMPILED the steps are taken by the compiled
+    run_steps(), if Numba is there.
+    """
+
+    def __init__(self, space, block=BLOCK, compiled=False):
+        self.space = space
+        self.block = block
+        self.steps = run_steps
+        if compiled:
+            self.steps = get_compiled_steps()
+            if self.steps == None:
+                print "Numba isn't installed, so the steps are run in Python"
+                self.steps = run_steps
+                compiled = False
+        self.compiled = compiled
+        cells = space.index_cells
+        self.cells = cells
+        self.urn = urn = cells[0].urn
+        n = len(cells)
+        T = urn.maxtype
+        S = T + 1
+        position = space.cell_index.positions
+
+        self.rules = [0] * (n*S*S)
+        self.rules_in = [0] * (n*S)
+        self.cell_rules = [0] * n
+        self.alive = [0] * n
+        self.size = [0] * (n*S)
+        self.act_i = [0] * n
+        self.act_o = [0] * n
+        self.nbr = [0] * (n*n)
+        self.nbr_count = [0] * n
+        self.place = [-1] * (n*n)
+        stored = []
+        for c, cell in enumerate(cells):
+            for i in range(S):
+                self.rules[(c*S + i)*S:(c*S + i + 1)*S] = cell.rule_counts[i]
+            self.rules_in[c*S:(c+1)*S] = cell.input_counts
+            self.cell_rules[c] = cell.count_rules
+            self.alive[c] = int(cell.isAlive)
+            if cell.active_rule != None:
+                self.act_i[c], self.act_o[c] = cell.active_rule.key
+            for ngh in cell.neighbors:
+                add_neighbor(self.nbr, self.nbr_count, self.place, n, c,
+                    position[ngh])
+            for t, products in cell.products.items():
+                self.size[c*S + t] = len(products)
+                stored.append((c*S + t, [p.get_energy() for p in products]))
+
+        cap = CAPACITY
+        while cap <= max([0] + self.size):
+            cap *= 2
+        self.energy = [0.] * (n*S*cap)
+        for s, energies in stored:
+            self.energy[s*cap:s*cap + len(energies)] = energies
+
+        self.type_counts = [count for row in space.type_counts
+            for count in row]
+        self.urn_counts = list(urn.counts)
+
+        # the cells on the grid, and the spots a move adds and removes
+        max_x, max_y = space.max_x, space.max_y
+        self.px = [int(x) for x in space.positions[:, 0]]
+        self.py = [int(y) for y in space.positions[:, 1]]
+        self.bucket = [0] * (max_x*max_y*n)
+        self.bucket_count = [0] * (max_x*max_y)
+        self.bucket_place = [0] * n
+        for c in range(n):
+            spot = (self.py[c] - 1)*max_x + self.px[c] - 1
+            self.bucket[spot*n + self.bucket_count[spot]] = c
+            self.bucket_place[c] = spot*n + self.bucket_count[spot]
+            self.bucket_count[spot] += 1
+        self.delta_x = []
+        self.delta_y = []
+        self.delta_start = [0]
+        for x_move in range(-1, 2):
+            for y_move in range(-1, 2):
+                for offsets in space.offsets.deltas[(x_move, y_move)]:
+                    self.delta_x.extend(offsets[:, 0].tolist())
+                    self.delta_y.extend(offsets[:, 1].tolist())
+                    self.delta_start.append(len(self.delta_x))
+        self.changed = [0] * n
+
+        probability = getattr(urn, "probability", 0.)
+        self.P = [n, S, urn.type, urn.count_products, int(bool(cells[0].intel)),
+            int(cells[0].repro_type == "target"), max_x, max_y, cap]
+        self.F = [probability, urn.initial_energy,
+            space.energy_costs["transform"], space.energy_costs["pass"],
+            space.energy_costs["reproduce"]]
+        self.counters = [space.master_count, space.last_added_rule,
+            space.cell_index.total, urn.total, max([0] + self.size)]
+
+        self.buffer = DrawBuffer(space.RNG)
+        self.draws = self.buffer.take(block).tolist()
+        self.k = 0
+        self.used = 0       # draws used before the current list
+
+
+    def grow(self):
+        """ Doubles the room for stored products.
+        """
+
+        cap = self.P[8]
+        if self.compiled:
+            energy = numpy.zeros(2*len(self.energy))
+        else:
+            energy = [0.] * (2*len(self.energy))
+        for s in range(len(self.size)):
+            energy[2*s*cap:2*s*cap + self.size[s]] = \
+                self.energy[s*cap:s*cap + self.size[s]]
+        self.energy = energy
+        self.P[8] = 2*cap
+
+
+    def refill(self):
+        """ Replaces the used draws with a new block.
+        """
+
+        self.used += self.k
+        if self.compiled:
+            self.draws = numpy.concatenate([self.draws[self.k:],
+                self.buffer.take(self.block)])
+        else:
+            self.draws = self.draws[self.k:] + \
+                self.buffer.take(self.block).tolist()
+        self.k = 0
+
+
+    def set_arrays(self, arrays):
+        """ Turns the packed state into NumPy arrays, for the compiled
+        run_steps(), or with ARRAYS false back into lists.
+        """
+
+        for name in INTEGERS + FLOATS:
+            value = getattr(self, name)
+            if arrays:
+                if name in INTEGERS:
+                    value = numpy.asarray(value, dtype=numpy.int64)
+                else:
+                    value = numpy.asarray(value, dtype=numpy.float64)
+            elif isinstance(value, numpy.ndarray):
+                value = value.tolist()
+            setattr(self, name, value)
+
+
+    def run(self, steps):
+        """ Runs the packed state until the master count reaches STEPS or
+        the run is absorbed (see Space.check_absorbed()), and returns the
+        master count.
+        """
+
+        space = self.space
+        self.set_arrays(self.compiled)
+        while True:
+            self.k, status = self.steps(self.P, self.F, self.rules,
+                self.rules_in, self.cell_rules, self.type_counts, self.alive,
+                self.energy, self.size, self.px, self.py, self.nbr,
+                self.nbr_count, self.place, self.bucket, self.bucket_count,
+                self.bucket_place, self.delta_x, self.delta_y,
+                self.delta_start, self.changed, self.act_i, self.act_o,
+                self.urn_counts, self.counters, self.draws, self.k, steps)
+
+            if status == DRAWS:
+                self.refill()
+            elif status == STORAGE:
+                self.grow()
+            elif status == EXTINCT:
+                self.sync_counts()
+                space.check_absorbed()
+                if space.absorbed != None:
+                    break
+            else:
+                break
+
+        return int(self.counters[0])
+
+
+    def sync_counts(self):
+        """ Puts the counts of steps and of rule types back into the space.
+        """
+
+        space = self.space
+        S = int(self.P[1])
+        type_counts = numpy.asarray(self.type_counts).tolist()
+        space.master_count = int(self.counters[0])
+        space.last_added_rule = int(self.counters[1])
+        for i in range(S):
+            space.type_counts[i][:] = type_counts[i*S:(i+1)*S]
+            space.input_totals[i] = sum(space.type_counts[i])
+        for o in range(S):
+            space.output_totals[o] = sum([space.type_counts[i][o]
+                for i in range(S)])
+
+
+    def sync(self):
+        """ Writes the packed state back into the cells, the space, the urn
+        and the random number generator, so the run can go on from there in
+        the object model.
+        """
+
+        space = self.space
+        urn = self.urn
+        cells = self.cells
+        self.set_arrays(False)
+        n, S, cap = self.P[0], self.P[1], self.P[8]
+        self.sync_counts()
+
+        for c, cell in enumerate(cells):
+            for i in range(S):
+                cell.rule_counts[i][:] = self.rules[(c*S + i)*S:
+                    (c*S + i + 1)*S]
+            cell.input_counts[:] = self.rules_in[c*S:(c+1)*S]
+            delta = self.cell_rules[c] - cell.count_rules
+            cell.count_rules = self.cell_rules[c]
+            if delta != 0:
+                space.cell_index.add(cell, delta)
+            cell.isAlive = bool(self.alive[c])
+            if self.act_i[c] > 0:
+                cell.active_rule = cell.rule_table[self.act_i[c]][
+                    self.act_o[c]]
+
+            # the stored products, made from the urn's pool
+            for products in cell.products.values():
+                urn.pool.extend(products)
+            cell.products = {}
+            for t in range(S):
+                s = c*S + t
+                if self.size[s] > 0:
+                    cell.products[t] = []
+                    for e in self.energy[s*cap:s*cap + self.size[s]]:
+                        product = urn.make_product(t)
+                        product.energy = e
+                        cell.products[t].append(product)
+
+            old_x, old_y = cell.get_location()
+            x, y = self.px[c], self.py[c]
+            if (old_x, old_y) != (x, y):
+                space.neighbor_grid[old_y-1][old_x-1].remove(cell)
+                space.neighbor_grid[y-1][x-1].append(cell)
+            cell.set_location(x, y)
+            space.positions[c] = (x, y)
+
+            cell.neighbors = AC_Cells.NeighborSet([cells[d] for d in
+                self.nbr[c*n:c*n + self.nbr_count[c]]])
+
+        urn.counts[:] = self.urn_counts
+        urn.total = self.counters[3]
+
+        self.buffer.finish(self.used + self.k)
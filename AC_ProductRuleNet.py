@@ -14,13 +14,49 @@ class ProductRuleNet:
     """ A NetworkX DiGraph object. The construction of the network is done
     by Cell instances who create a ProductNetRule for each type of rule they 
     have (not each rule, of which we expect duplicates).
+
+    Finding the cycles is by far the most expensive thing the net does, so
+    they are found once and kept until a node or edge changes. In the
+    incremental mode, only the strongly connected components with a node
+    that was touched since the last search are searched again. Every cycle
+    lies inside one component, so the others can keep their cycles.
+
+    Large nets can have far too many cycles to hold in memory. In the
+    counting mode the cycles are streamed one at a time by iter_cycles()
+    instead, optionally only up to MAX_LENGTH nodes, and the plus3
+    questions stop at the first cycle that answers them.
+
+    Normally the net is built once from the cells at the end of a run. A
+    live net is instead kept up to date by the cells and the Space as rules
+    appear and die out and as neighbors come and go, so the cycles can be
+    looked at any time during a run.
     """
     
-    def __init__(self):
+    def __init__(self, incremental=True, counting=False, max_length=None):
         self.net = networkx.DiGraph()
         self.cycle_counts = {}
         self.has_cycles = True
         self.pos = None #filled in later
+        self.incremental = incremental
+        self.cycles = None          # None until found, and once changed
+        self.complexities = None
+        self.touched = set()        # nodes changed since the last search
+        self.component_cycles = {}  # frozenset of nodes -> its cycles
+        self.counting = counting
+        self.max_length = max_length
+        self.counted = None         # cycle counts kept in the counting mode
+        self.live = False           # set by build(live=True)
+
+
+    def touch(self, *nodes):
+        """ Records that NODES (or their edges) changed, so the cycles that
+        were found before are out of date.
+        """
+
+        self.touched.update(nodes)
+        self.cycles = None
+        self.complexities = None
+        self.counted = None
            
     def add_ProductNetRule(self, aProductNetRule):
         """ This turn the ProductNetRule to a node in the network.
@@ -31,6 +67,7 @@ class ProductRuleNet:
             but because a NetworkX network will take any hashable as a node,
             it seemed prudent."""
             self.net.add_node(aProductNetRule)
+            self.touch(aProductNetRule)
 
         else:
             a = ("%s is not a ProductNetRule and therefore can't"+
@@ -42,6 +79,9 @@ class ProductRuleNet:
         """ This removes the node/ProductNetRule from the network. NetworkX
         automatically removes adjacent edges in the network.
         """
+        # the rules it was connected to lose edges as well.
+        self.touch(theProductNetRule, *self.net.predecessors(theProductNetRule))
+        self.touch(*self.net.successors(theProductNetRule))
         self.net.remove_node(theProductNetRule)
             
     
@@ -54,12 +94,14 @@ class ProductRuleNet:
             if rule1.get_output() == rule2.get_input():
                 if self.net.has_edge(rule1, rule2) == False:
                     self.net.add_edge(rule1, rule2)
+                    self.touch(rule1, rule2)
                 else:
                     pass
 
             elif rule2.get_output() == rule1.get_input():
                 if self.net.has_edge(rule2, rule1) == False:
                     self.net.add_edge(rule2, rule1)
+                    self.touch(rule1, rule2)
                 else:
                     pass
 
@@ -71,14 +113,189 @@ class ProductRuleNet:
             raise TypeError(a)
 
 
+    def remove_edge(self, rule1, rule2):
+        """ Removes the edge from RULE1 to RULE2 if there is one.
+        """
+
+        if self.net.has_edge(rule1, rule2):
+            self.net.remove_edge(rule1, rule2)
+            self.touch(rule1, rule2)
+
+
+    def connect_rule(self, rule, cells):
+        """ Adds the edges between a new NetRule and the NetRules of CELLS,
+        in whichever directions they are compatible.
+        """
+
+        for cell in cells:
+            for other in cell.product_netrules.values():
+                self.add_edge(rule, other)
+                self.add_edge(other, rule)
+
+
+    def connect_cells(self, cell1, cell2):
+        """ Adds the edges between the NetRules of two new neighbors.
+        """
+
+        for rule in cell1.product_netrules.values():
+            self.connect_rule(rule, [cell2])
+
+
+    def disconnect_cells(self, cell1, cell2):
+        """ Removes the edges between the NetRules of two cells that are no
+        longer neighbors.
+        """
+
+        for rule1 in cell1.product_netrules.values():
+            for rule2 in cell2.product_netrules.values():
+                self.remove_edge(rule1, rule2)
+                self.remove_edge(rule2, rule1)
+
+
+    def build(self, cells, live=False):
+        """ Fills the net from the rules the CELLS currently hold, with one
+        ProductNetRule per rule type per cell and an edge wherever neighbors
+        hold compatible rules. If LIVE, the cells and the Space keep the net
+        up to date from then on.
+        """
+
+        for cell in cells:
+            cell.productRule_Net = self
+            cell.sync_ProductNetRules()
+
+        #Filling in the actual compatible rule network.
+        for cell in cells:
+            if cell.product_netrules != {}:
+                for ngh in cell.neighbors:
+                    if ngh.product_netrules != {}:
+                        for r1 in cell.product_netrules.values():
+                            for r2 in ngh.product_netrules.values():
+                                # check of compatibility in funct.
+                                self.add_edge(r1,r2)
+
+        self.live = live
+
+
+    def get_cycles(self):
+        """ The list of cycles in the net, each a list of nodes. They are
+        found with the NetworkX recursive_simple_cycles() function the first
+        time they are asked for after a change and kept until the next one.
+        """
+
+        if self.cycles != None:
+            return self.cycles
+
+        if not self.incremental:
+            self.cycles = networkx.recursive_simple_cycles(self.net)
+            self.touched = set()
+            return self.cycles
+
+        cycles = []
+        component_cycles = {}
+        for component in networkx.strongly_connected_components(self.net):
+            if len(component) == 1:
+                node = next(iter(component))
+                if not self.net.has_edge(node, node):
+                    continue
+
+            key = frozenset(component)
+            if key in self.component_cycles and \
+                self.touched.isdisjoint(key):
+                found = self.component_cycles[key]
+            else:
+                found = networkx.recursive_simple_cycles(
+                    self.net.subgraph(component))
+
+            component_cycles[key] = found
+            cycles.extend(found)
+
+        self.component_cycles = component_cycles
+        self.touched = set()
+        self.cycles = cycles
+        return self.cycles
+
+
+    def iter_cycles(self, max_length=None):
+        """ A generator over the cycles of the net that never holds more
+        than the current path. Each start node is searched depth first, so
+        the cycles come in the order the search finds them, not by length.
+        Cycles with more than MAX_LENGTH nodes are skipped. The list yielded
+        is the search's own path, so copy it if it needs to be kept.
+        """
+
+        succ = self.net.succ
+        for component in networkx.strongly_connected_components(self.net):
+            if len(component) == 1:
+                node = next(iter(component))
+                if self.net.has_edge(node, node):
+                    yield [node]
+                continue
+
+            # a cycle is found only from its lowest ranked node
+            rank = {}
+            for k, node in enumerate(component):
+                rank[node] = k
+
+            for start, k in rank.items():
+                path = [start]
+                on_path = set(path)
+                stack = [iter(succ[start])]
+                while stack:
+                    for nxt in stack[-1]:
+                        if nxt is start:
+                            yield path
+                        elif rank.get(nxt, -1) > k and nxt not in on_path \
+                            and (max_length == None or
+                            len(path) < max_length):
+                            path.append(nxt)
+                            on_path.add(nxt)
+                            stack.append(iter(succ[nxt]))
+                            break
+                    else:
+                        stack.pop()
+                        on_path.discard(path.pop())
+
+
+    def count_cycles(self, max_length=None):
+        """ The number of cycles of each length, found by streaming through
+        iter_cycles() rather than listing them.
+        """
+
+        counts = {}
+        for cycle in self.iter_cycles(max_length):
+            length = len(cycle)
+            try:
+                counts[length] += 1
+            except KeyError:
+                counts[length] = 1
+        return counts
+
+
+    def has_cycle(self, min_types=0, min_owners=0, max_length=None):
+        """ Whether there is a cycle longer than two with at least MIN_TYPES
+        distinct rule types and MIN_OWNERS distinct cells. The search stops
+        at the first one it finds.
+        """
+
+        for cycle in self.iter_cycles(max_length):
+            if len(cycle) > 2:
+                types = set()
+                owners = set()
+                for rule in cycle:
+                    types.add((rule.get_input(), rule.get_output()))
+                    owners.add(rule.get_owner())
+                if len(types) >= min_types and len(owners) >= min_owners:
+                    return True
+        return False
+
+
     def return_cycles(self):
-        """ A direct route to the NetworkX simple cycles finding function.
-        This method is only ever used in debugging because the method
-        update_cycle_counts() below packages the information in a more
-        useful way
+        """ A direct route to the cycles of the net. This method is only
+        ever used in debugging because the method update_cycle_counts()
+        below packages the information in a more useful way
         """
 
-        return networkx.recursive_simple_cycles(self.net)
+        return self.get_cycles()
         
 
     def update_cycle_counts(self, time_step):
@@ -89,21 +306,26 @@ class ProductRuleNet:
         of nodes in the cycle where the last one is dropped because it is the
         same as the first. Thus a (sub) list of length 2 is not a self-loop, 
         but a path from one node to another and back and cycles must be
-        of length two or greater. 
+        of length two or greater. In the counting mode the cycles are
+        counted as they are streamed and never listed.
         """
         
-        cycles = networkx.recursive_simple_cycles(self.net)
+        if self.counting:
+            if self.counted == None:
+                self.counted = self.count_cycles(self.max_length)
+            self.cycle_counts = dict(self.counted)
 
-        self.cycle_counts = {}
-        for i in cycles:
-            length = len(i)
-            try:
-                self.cycle_counts[length] += 1
-            except:
-                self.cycle_counts[length] = 1
+        else:
+            self.cycle_counts = {}
+            for i in self.get_cycles():
+                length = len(i)
+                try:
+                    self.cycle_counts[length] += 1
+                except:
+                    self.cycle_counts[length] = 1
         
         # If there are no cycles, this run is dead and we need to send word
-        if len(cycles) == 0:
+        if len(self.cycle_counts) == 0:
             self.has_cycles = False
             return False
         else:
@@ -112,9 +334,16 @@ class ProductRuleNet:
     
     def get_cycle_complexity(self):
         """ This function looks at the cycles that are longer than two.
+        Like the cycles, the result is kept until the net changes.
         """
 
-        cycles = networkx.recursive_simple_cycles(self.net)
+        if self.complexities != None:
+            return self.complexities
+
+        if self.counting:
+            cycles = self.iter_cycles(self.max_length)
+        else:
+            cycles = self.get_cycles()
         complexities = {} # keys are lengths, entries are # of distinct rules.
         rule_owners = {}
         for cycle in cycles:
@@ -142,6 +371,7 @@ class ProductRuleNet:
                 except:
                     complexities[length] = [(count_types,count_owners)]
                     
+        self.complexities = complexities
         return complexities
         
     
@@ -149,6 +379,9 @@ class ProductRuleNet:
         """ Returns whether there is a cycle of length of at least 3
         that include at least 3 distinct rules.
         """ 
+
+        if self.counting:
+            return self.has_cycle(min_types=3, max_length=self.max_length)
     
         for length_type in self.get_cycle_complexity().values():
             for instance in length_type:
@@ -161,6 +394,9 @@ class ProductRuleNet:
         """ Returns whether there is a cycle of length of at least 3
         that include at least 3 cells.
         """
+
+        if self.counting:
+            return self.has_cycle(min_owners=3, max_length=self.max_length)
     
         for length_type in self.get_cycle_complexity().values():
             for instance in length_type:
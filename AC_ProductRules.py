@@ -10,15 +10,19 @@ sets that define the relevant "chemistries."
 Written by Jon Atwell
 """
 
-class ProductRule:
+class ProductRule(object):
     """ The rule that defines a 'skill' a cell might possess. It can be used 
     to transform the type of a Product instance from type INPUT to 
-    type OUTPUT.
+    type OUTPUT. Its KEY, the tuple (INPUT, OUTPUT), is what the cells file
+    their ProductNetRules under.
     """
+
+    __slots__ = ("input", "output", "key")
     
     def __init__(self, input, output):
         self.input = input
         self.output = output
+        self.key = (input, output)
 
         
     def get_input(self):
@@ -28,21 +32,44 @@ class ProductRule:
         return self.output
     
     def get_name(self):
-        """ Used as the key for the related ProductNetRules."""
-        return "-".join([str(self.input), str(self.output)])
+        """ The rule as a string, e.g. 1-2."""
+        return "%d-%d" %(self.input, self.output)
         
     def __str__(self):
         return "Rule has input %d and output %d" %(self.input, self.output)
         
     
         
-class ProductNetRule:
+# one shared ProductRule per (input, output) pair, built on first use.
+rule_tables = {}
+
+def get_rule_table(maxProductType):
+    """ A table of ProductRules indexed as table[input][output]. Cells only
+    keep counts of their rules, and since rules of the same type are
+    interchangeable the rule handed out for a type is always this one.
+    """
+
+    try:
+        return rule_tables[maxProductType]
+    except KeyError:
+        table = [[None] * (maxProductType+1) for i in range(maxProductType+1)]
+        for i in range(1, maxProductType+1):
+            for j in range(1, maxProductType+1):
+                table[i][j] = ProductRule(i, j)
+        rule_tables[maxProductType] = table
+        return table
+
+
+
+class ProductNetRule(object):
     """ A class of object closely related to ProductRule but used to count 
     autocatalytic cycles. A cell will create a ProductNetRule for every type
     of ProductRule (i.e. unique input and output combination) they have.
     The ProductNetRule keeps track of how many actual ProductRules are of
     that type."""
 
+    __slots__ = ("input", "output", "count", "owner", "location")
+
     def __init__(self, input, output, count):
         self.input = input
         self.output = output
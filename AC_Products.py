@@ -8,11 +8,13 @@ Written by Jon Atwell
 """
 
 
-class Product:
+class Product(object):
     """ This class is for the fundamental extra-cellular unit, some sort of
     distinguishable goods that are passed around by the cells and transformed
     along the way.
     """
+
+    __slots__ = ("owner", "energy", "type")
     
     
     def __init__(self, owning_Urn, type, energy):
@@ -74,6 +76,12 @@ class Urn:
     (fixed-rich, fixed-poor, endo-rich and endo-poor) [where 'endo' means
     endogenous] and the calling Cell's search intelligence 
     (selective or random).
+
+    Products in the urn all have the initial energy and nothing else sets
+    them apart, so the urn only keeps a count of each type (counts[type],
+    with counts[0] unused) and their total. Products that come back, from
+    any kind of urn, go into a pool and are handed out again, so a run
+    doesn't make a new Product for every request.
     """
     
     def __init__(self, urn_type, count_product_types, RNG, energy, 
@@ -86,7 +94,9 @@ class Urn:
         self.RNG = RNG 
         self.maxtype = count_product_types
         self.count_products = count_products
-        self.collection = {}
+        self.counts = [0] * (self.maxtype + 1)
+        self.total = 0
+        self.pool = []      # returned Products, ready to be handed out
         
         if  "fixed-rich" in urn_type:
             self.type = 1
@@ -99,18 +109,16 @@ class Urn:
         elif "endo-rich" in urn_type:
             self.type = 3
             for i in range(self.maxtype):
-                self.collection[i+1] = ([Product(self, (i+1), 
-                    self.initial_energy) for j in range(int(count_products/float(self.maxtype)))])
+                self.counts[i+1] = int(count_products/float(self.maxtype))
             
         elif  "endo-poor" in urn_type:
             self.type = 4
-            self.collection = ({1:[Product(self,1, self.initial_energy) 
-                for i in range(count_products)]})
-            for i in range(self.maxtype-1):
-                self.collection[i+2] = []
+            self.counts[1] = count_products
 
         else:
             raise ValueError("%s is an invalid Urn type" %type)
+
+        self.total = sum(self.counts)
             
     
     def request_product(self, desired_output, selective=False):
@@ -125,35 +133,29 @@ class Urn:
         if selective:
             
             if self.type == 1: # type = Rich
-                return Product(self, desired_output, self.initial_energy)
+                return self.make_product(desired_output)
                     
             # if the active rule calls for a 1, hand one over
             elif self.type == 2: # type = Poor
                 if desired_output == 1:
-                    return Product(self, 1, self.initial_energy)
+                    return self.make_product(1)
                 else:
                     return None
                      
             # This urn started with all products. 
             elif self.type == 3: # type = Endo-Rich
-                    try:
-                        return self.collection[desired_output].pop()
-                    except:
-                        return None
+                return self.take_product(desired_output)
                         
             # Return what is asked for if it is available.      
             elif self.type == 4: #Type = Endo-Poor
-                try:
-                    return self.collection[desired_output].pop()
-                except:
-                    return None
+                return self.take_product(desired_output)
         
         # random search returns the desired product with uniform probability
         elif selective == False:
             
             if self.type == 1: #type=rich
                 if self.RNG.random() <= self.probability:
-                    return Product(self, desired_output, self.initial_energy)
+                    return self.make_product(desired_output)
                 else:
                     return None
             
@@ -162,7 +164,7 @@ class Urn:
             # 1-product so random search is still intelligent search.        
             elif self.type == 2: #type=poor
                 if desired_output == 1:
-                    return Product(self, 1, self.initial_energy)
+                    return self.make_product(1)
                 else:
                     return None
             
@@ -173,46 +175,69 @@ class Urn:
             # types.
 
             elif self.type == 3: #type=Endo-rich
-                if desired_output in self.collection.keys():
-                    count = len(self.collection[desired_output])
-                    try:
-                        if self.RNG.randint(1, self.count_products) <= count:
-                            return self.collection[desired_output].pop()
-                    except:
-                        return None
-                else:
-                    return None
+                if self.RNG.randint(1, self.count_products) <= \
+                    self.counts[desired_output]:
+                    return self.take_product(desired_output)
+                return None
             
                         
             # Returns the desired product with probability proportional to
             # the current distribution of product types. The initial 
-            # distribution is all ones.
+            # distribution is all ones. The draw is the one RNG.sample()
+            # made on a list with an entry per product, in type order.
             elif self.type == 4: #type=Endo-poor
-                poss = []
-                for i in self.collection.keys():
-                    for j in range(len(self.collection[i])):
-                        poss.append(i)
-                try:
-                        if self.RNG.sample(poss,1)[0] == desired_output:
-                            return self.collection[desired_output].pop()
-                except:
-                        return None
+                if self.total == 0:
+                    return None
+                r = int(self.RNG.random() * self.total)
+                for i in range(1, self.maxtype + 1):
+                    r -= self.counts[i]
+                    if r < 0:
+                        break
+                if i == desired_output:
+                    return self.take_product(desired_output)
+                return None
             else:
                 raise ValueError("%s is an invalid Urn type" %self.type)
                     
         else:
             raise ValueError("%s is an invalid intelligence type" %selective)
 
+
+    def take_product(self, type):
+        """ Takes a product of TYPE out of the urn, or returns None if
+        there isn't one.
+        """
+
+        if self.counts[type] <= 0:
+            return None
+        self.counts[type] -= 1
+        self.total -= 1
+        return self.make_product(type)
+
+
+    def make_product(self, type):
+        """ A Product of TYPE with the initial energy. One from the pool is
+        reused if there is one.
+        """
+
+        if self.pool:
+            product = self.pool.pop()
+            product.type = type
+            product.energy = self.initial_energy
+            return product
+        return Product(self, type, self.initial_energy)
+
     
     def return_product(self, product):
         """ A method for placing transformed Products back into the Urn.
         This only really matters when the Urn is of the endogenous type
         because we need to change the distribution of available Products.
-        If the Urn is of type fix, we just 'drop the ball'.
+        If the Urn is of type fix, we just 'drop the ball'. Either way the
+        Product itself goes into the pool, so nobody may hold on to it.
         """
         if self.type == 3 or self.type == 4:
-            product.replenish_energy()
-            self.collection[product.get_type()].append(product)
+            self.counts[product.get_type()] += 1
+            self.total += 1
         
         else:
             try:
@@ -221,10 +246,29 @@ class Urn:
                 # if the if-statement is false, ball is "dropped" by now. 
             except:
                 raise TypeError("Argument is not a Product instance")
+
+        self.pool.append(product)
         
         
+    def get_count(self, type):
+        """ The number of products of TYPE in the urn. Fixed urns don't
+        hold any products.
+        """
+
+        return self.counts[type]
+
+
+    def get_types(self):
+        """ The product types the urn holds; none for fixed urns.
+        """
+
+        if self.type == 3 or self.type == 4:
+            return range(1, self.maxtype + 1)
+        return []
+
+
     def __str__(self):
-        return str(self.collection)
+        return str(dict(zip(self.get_types(),
+            [self.counts[i] for i in self.get_types()])))
     
 
-    
\ No newline at end of file
@@ -0,0 +1,142 @@
+""" This module hands out the random number generators of a run. A run used
+to have one random.Random(seed) that the Urn, the rules, the Cells and the
+Space all drew from, so a change in how often one of them draws shifts what
+all the others get. Here each subsystem gets its own stream, seeded from
+the run's seed and the subsystem's name by a hash, so streams are
+independent of each other and of the machine or process a run is on.
+
+BlockRandom is a random.Random that can also hand over the next stretch
+of its stream as an array, for code that works on many draws at once.
+NumPy's RandomState and random.Random are the same Mersenne Twister seeded
+the same way, so the array is drawn by NumPy from a copy of the
+generator's state, which is then moved on past it. Single numbers still
+come from random.Random itself at its own speed, and a run doesn't change
+when it is switched on.
+
+
+Written by Jon Atwell
+"""
+
+import hashlib
+import numpy
+import random
+
+
+SUBSYSTEMS = ["rules", "urn", "cells", "space"]
+
+
+def derive_seed(*keys):
+    """ A seed made from KEYS (a seed followed by names or numbers). The
+    same keys always give the same seed.
+    """
+
+    key = ":".join([str(k) for k in keys])
+    return int(hashlib.md5(key).hexdigest()[:15], 16)
+
+
+def get_words(seed):
+    """ SEED split into the 32-bit words NumPy's RandomState is seeded
+    with.
+    """
+
+    seed = abs(int(seed))
+    words = []
+    while True:
+        words.append(seed & 0xffffffff)
+        seed >>= 32
+        if seed == 0:
+            return words
+
+
+def get_numpy_state(RNG):
+    """ The state of the random.Random RNG in the form NumPy's
+    RandomState.set_state() takes.
+    """
+
+    internal = RNG.getstate()[1]
+    return ("MT19937", numpy.array(internal[:-1], dtype=numpy.uint32),
+        internal[-1])
+
+
+def set_numpy_state(RNG, numpy_state):
+    """ Puts the random.Random RNG in the state NUMPY_STATE of a NumPy
+    RandomState. Its next Gaussian, if it has one, stays.
+    """
+
+    version, internal, gauss_next = RNG.getstate()
+    internal = tuple([int(word) for word in numpy_state[1]]) + \
+        (int(numpy_state[2]),)
+    RNG.setstate((version, internal, gauss_next))
+
+
+
+class BlockRandom(random.Random):
+    """ A random.Random with random_array(), which hands over BLOCK numbers
+    at a time unless asked for another number. Everything else, including
+    getstate(), setstate() and jumpahead(), is random.Random's own.
+    """
+
+    def __new__(cls, seed=None, block=4096):
+        # the underlying C generator only takes the seed
+        return random.Random.__new__(cls, seed)
+
+
+    def __init__(self, seed=None, block=4096):
+        self.block = block
+        random.Random.__init__(self, seed)
+
+
+    def random_array(self, n=None):
+        """ The next N numbers of the stream (BLOCK by default) as an array,
+        the same ones N calls to random() would give.
+        """
+
+        if n == None:
+            n = self.block
+        state = numpy.random.RandomState()
+        state.set_state(get_numpy_state(self))
+        draws = state.random_sample(n)
+        set_numpy_state(self, state.get_state())
+        return draws
+
+
+    def __reduce__(self):
+        return (self.__class__, (None, self.block), self.getstate())
+
+
+
+class Streams:
+    """ The generators of one run, one per subsystem, all derived from
+    SEED. With BLOCK they are BlockRandoms drawing that many numbers at a
+    time, otherwise plain random.Randoms.
+    """
+
+    def __init__(self, seed, block=None):
+        self.seed = seed
+        self.block = block
+        self.generators = {}
+
+
+    def get(self, name):
+        """ The generator for the subsystem NAME, made on first use.
+        """
+
+        try:
+            return self.generators[name]
+        except KeyError:
+            seed = derive_seed(self.seed, name)
+            if self.block:
+                generator = BlockRandom(seed, self.block)
+            else:
+                generator = random.Random(seed)
+            self.generators[name] = generator
+            return generator
+
+
+    def get_numpy(self, name):
+        """ A NumPy RandomState for the subsystem NAME, for drawing whole
+        arrays at once. It is independent of the stream get() gives.
+        """
+
+        return numpy.random.RandomState(get_words(derive_seed(self.seed,
+            name, "numpy")))
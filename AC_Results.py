@@ -0,0 +1,201 @@
+""" This module stores the results of runs as fixed-size binary records
+instead of lines of text. A file NAME.rec is a HEADER followed by nothing
+but records of the RECORD type below, one per run, so:
+
+    - sweep workers can append to it at the same time (each append is one
+      locked write of whole records),
+    - the plotter can memory-map it and work on whole columns at once.
+
+Cycle counts are a fixed-width column: cycles[k] is the number of cycles
+of length k, and the last entry counts every cycle of MAX_CYCLE_LENGTH or
+more. Old CSV files from print_data() can be read with from_csv(). A run
+that stopped early has fewer steps than asked for and says why in
+absorbed, an index into ABSORBED. The header names the layout of the
+records (VERSION and their size), and a file in any other layout is
+refused rather than read wrong.
+
+
+Written by Jon Atwell
+"""
+
+import fcntl
+import os
+import numpy
+
+
+MAX_CYCLE_LENGTH = 64
+
+# why a run stopped early, stored as its index here (0: it didn't)
+ABSORBED = [None, "frozen", "acyclic", "converged"]
+
+RECORD = numpy.dtype([
+    ("run", numpy.int32),
+    ("seed", numpy.uint64),
+    ("active", numpy.bool_),
+    ("cycles", numpy.int32, (MAX_CYCLE_LENGTH+1,)),
+    ("plus3cell", numpy.bool_),
+    ("plus3rule", numpy.bool_),
+    ("alive", numpy.int32),
+    ("last_added_rule", numpy.int64),
+    ("steps", numpy.int64),
+    ("absorbed", numpy.int8)])
+
+
+# bumped whenever RECORD changes
+VERSION = 2
+MAGIC = "AC_REC"
+
+HEADER = numpy.dtype([
+    ("magic", "S8"),
+    ("version", numpy.uint32),
+    ("itemsize", numpy.uint32)])
+
+
+def make_header():
+    """ The header of a file of records in the current layout.
+    """
+
+    header = numpy.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["itemsize"] = RECORD.itemsize
+    return header
+
+
+def check_header(filename, data):
+    """ Raises a ValueError unless DATA, the start of FILENAME, is the
+    header of the current layout.
+    """
+
+    if len(data) < HEADER.itemsize:
+        raise ValueError("%s is too short to have a header" %filename)
+    header = numpy.fromstring(data[:HEADER.itemsize], dtype=HEADER)[0]
+    if header["magic"] != MAGIC:
+        raise ValueError("%s has no header; it was written before records "
+            "had one and can't be read" %filename)
+    if header["version"] != VERSION or \
+        header["itemsize"] != RECORD.itemsize:
+        raise ValueError("%s has records of version %d (%d bytes), not %d "
+            "(%d bytes)" %(filename, header["version"], header["itemsize"],
+            VERSION, RECORD.itemsize))
+
+
+def make_record(results):
+    """ A single record made from the dictionary that
+    HeadlessModel.get_results() returns.
+    """
+
+    record = numpy.zeros(1, dtype=RECORD)
+    for key in ["run", "seed", "active", "plus3cell", "plus3rule", "alive",
+        "last_added_rule", "steps"]:
+        record[key] = results[key]
+    record["absorbed"] = ABSORBED.index(results.get("absorbed"))
+    for length, count in results["cycle_counts"].items():
+        record["cycles"][0, min(length, MAX_CYCLE_LENGTH)] += count
+    return record
+
+
+def append_records(filename, records):
+    """ Appends RECORDS to FILENAME under an exclusive lock, so several
+    processes can add to the same file. A new file gets the header first,
+    and records are never added to a file in another layout.
+    """
+
+    records = numpy.asarray(records, dtype=RECORD)
+    output_file = open(filename, "a+b")
+    try:
+        fcntl.flock(output_file, fcntl.LOCK_EX)
+        output_file.seek(0)
+        start = output_file.read(HEADER.itemsize)
+        if start == "":
+            output_file.write(make_header().tostring())
+        else:
+            check_header(filename, start)
+        output_file.seek(0, os.SEEK_END)
+        output_file.write(records.tostring())
+        output_file.flush()
+    finally:
+        fcntl.flock(output_file, fcntl.LOCK_UN)
+        output_file.close()
+
+
+def load_records(filename, unique=True):
+    """ The records in FILENAME, memory-mapped. If a run was written more
+    than once (a sweep stopped between writing a record and its CSV line)
+    only the last copy is kept when UNIQUE. Raises a ValueError if the file
+    isn't in the current layout (see VERSION).
+    """
+
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return numpy.zeros(0, dtype=RECORD)
+
+    datafile = open(filename, "rb")
+    check_header(filename, datafile.read(HEADER.itemsize))
+    datafile.close()
+
+    # a record cut short by an interruption is left out
+    count = (os.path.getsize(filename) - HEADER.itemsize) // RECORD.itemsize
+    if count == 0:
+        return numpy.zeros(0, dtype=RECORD)
+    records = numpy.memmap(filename, dtype=RECORD, mode="r",
+        offset=HEADER.itemsize, shape=(count,))
+
+    if unique:
+        runs = records["run"][::-1]
+        first = numpy.unique(runs, return_index=True)[1]
+        if len(first) < count:
+            return records[numpy.sort(count - 1 - first)]
+    return records
+
+
+def from_csv(filename, steps=0):
+    """ Reads the lines print_data() writes into records. The CSV files
+    don't have seeds or step counts, so STEPS is used for every run.
+    """
+
+    records = []
+    datafile = open(filename, "r")
+    for line in datafile:
+        if not line.endswith("\n"):
+            continue
+        pre = line.replace("{","|").replace("}","|")
+        raw = pre.strip().split("|")
+        results = {"run": int(raw[0].split(",")[0]), "seed": 0,
+            "steps": steps, "cycle_counts": {}}
+
+        if len(raw) == 1:
+            # a run that was recorded as zeros
+            after = raw[0].split(",")
+            results["active"] = False
+            results["plus3cell"] = False
+            results["plus3rule"] = False
+            results["alive"] = 0
+            results["last_added_rule"] = int(after[5])
+        else:
+            for i in raw[1].split(","):
+                if ":" in i:
+                    j,k = i.split(":")
+                    results["cycle_counts"][int(j)] = int(k)
+            after = raw[2].split(",")
+            results["active"] = True
+            results["plus3cell"] = after[1] == "True"
+            results["plus3rule"] = after[2] == "True"
+            results["alive"] = int(after[3])
+            results["last_added_rule"] = int(after[4])
+
+        records.append(make_record(results))
+    datafile.close()
+
+    if records == []:
+        return numpy.zeros(0, dtype=RECORD)
+    return numpy.concatenate(records)
+
+
+def load_configuration(name, steps=0):
+    """ The results for a configuration: NAME.rec if there is one,
+    otherwise NAME.csv.
+    """
+
+    if os.path.exists(name+".rec"):
+        return load_records(name+".rec")
+    return from_csv(name+".csv", steps)
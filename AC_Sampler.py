@@ -0,0 +1,119 @@
+""" This module records how a run develops. A Sampler is handed to the Space,
+which calls it every EVERY steps. Each sample holds the step, the number of
+living cells, the rules of every cell, the contents of the urn and the
+number of rules of each type, and goes into NumPy arrays that are
+allocated once. When they fill up they are written to disk in one go (or,
+without a file, the oldest samples are overwritten), so nothing is printed
+or allocated in between.
+
+
+Written by Jon Atwell
+"""
+
+import glob
+import numpy
+
+
+class Sampler:
+    """ Preallocated ring buffers of samples of a run.
+    """
+
+    def __init__(self, space, urn, every=1000, capacity=1000, filename=None):
+        self.space = space
+        self.urn = urn
+        self.cells = space.cell_index.cells
+        self.every = every
+        self.capacity = capacity
+        self.filename = filename
+        self.next_sample = (space.master_count // every + 1) * every
+        self.count = 0          # samples in the buffers
+        self.position = 0       # where the next one goes
+        self.chunks = 0         # chunks already written to disk
+
+        types = urn.maxtype
+        self.steps = numpy.zeros(capacity, dtype=numpy.int64)
+        self.alive = numpy.zeros(capacity, dtype=numpy.int64)
+        self.rules = numpy.zeros((capacity, len(self.cells)),
+            dtype=numpy.int64)
+        self.urn_counts = numpy.zeros((capacity, types), dtype=numpy.int64)
+        self.rule_types = numpy.zeros((capacity, types, types),
+            dtype=numpy.int64)
+
+
+    def sample(self):
+        """ Records the current state of the run.
+        """
+
+        i = self.position
+        self.steps[i] = self.space.master_count
+
+        rules = self.rules[i]
+        rule_types = self.rule_types[i]
+        rule_types[:] = 0
+        for c, cell in enumerate(self.cells):
+            rules[c] = cell.count_rules
+            if cell.count_rules > 0:
+                # the cell's counts are indexed from 1
+                rule_types += numpy.array(cell.rule_counts)[1:,1:]
+        self.alive[i] = numpy.count_nonzero(rules)
+
+        for t in range(self.urn.maxtype):
+            self.urn_counts[i, t] = self.urn.get_count(t+1)
+
+        self.next_sample = (self.space.master_count // self.every + 1) * \
+            self.every
+        self.position = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+        if self.count == self.capacity and self.filename != None:
+            self.flush()
+
+
+    def get_samples(self):
+        """ The samples in the buffers, oldest first, as a dictionary of
+        arrays.
+        """
+
+        if self.count < self.capacity:
+            order = numpy.arange(self.count)
+        else:
+            order = (numpy.arange(self.capacity) + self.position) % \
+                self.capacity
+
+        return {"steps": self.steps[order],
+            "alive": self.alive[order],
+            "rules": self.rules[order],
+            "urn": self.urn_counts[order],
+            "rule_types": self.rule_types[order]}
+
+
+    def flush(self):
+        """ Writes the buffered samples to FILENAME-#####.npz and empties
+        the buffers.
+        """
+
+        if self.filename == None or self.count == 0:
+            return
+
+        numpy.savez("%s-%05d.npz" %(self.filename, self.chunks),
+            **self.get_samples())
+        self.chunks += 1
+        self.count = 0
+        self.position = 0
+
+
+
+def load_samples(filename):
+    """ Joins the chunks a Sampler wrote to FILENAME back into a dictionary
+    of arrays.
+    """
+
+    chunks = [numpy.load(name) for name in
+        sorted(glob.glob(filename + "-[0-9]*.npz"))]
+    if chunks == []:
+        return {}
+
+    samples = {}
+    for key in chunks[0].files:
+        samples[key] = numpy.concatenate([chunk[key] for chunk in chunks])
+    return samples
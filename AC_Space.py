@@ -1,6 +1,15 @@
 """ This is a module that constructs a 2-dimensional space the cells can move
 around in. Currently, it only supports Brownian motion with a periodic
-boundary condition.
+boundary condition. With motion="Brownian" a cell takes a step each time it
+is activated. With motion="synchronous" nobody moves on activation;
+instead, every MOVE_EVERY steps all the living cells take a step at once,
+drawn in one go from a NumPy RandomState, and the neighbors are worked out
+again in one pass.
+
+The cells' locations are also kept in a NumPy array. The grid of buckets
+(neighbor_grid) answers which cells are at a spot, and the cached
+OffsetTables say which spots are in range and which change with a move, so
+finding a cell's neighbors only looks at the cells around it.
 
 
 Written by Jon Atwell
@@ -8,33 +17,93 @@ Written by Jon Atwell
 
 import random
 import numpy
+import AC_CellIndex
+import AC_Cells
+
+
+# OffsetTables already made, keyed by (radius, dimensions)
+offset_tables = {}
+
+
+def get_offset_table(radius, dimensions):
+    """ The OffsetTable for RADIUS on a torus of DIMENSIONS. Each is only
+    worked out once.
+    """
+
+    key = (radius, tuple(dimensions))
+    try:
+        return offset_tables[key]
+    except KeyError:
+        offset_tables[key] = OffsetTable(radius, dimensions)
+        return offset_tables[key]
 
 
 def within_radius(radius, point):
+    """ The grid points within RADIUS of POINT, not yet wrapped onto the
+    torus.
+    """
 
-    # need to clean with the taurus map
+    reach = int(numpy.ceil(radius))
     the_list = []
-    for x in range(int(point[0] - numpy.ceil(radius)),int(point[0] + numpy.ceil(radius) + 1)):
-        for y in range(int(point[1]- numpy.ceil(radius)), int(point[1] + numpy.ceil(radius) + 1)):
-            if ((point[0]-x)**2 + (point[1]-y)**2)**.5 <= radius:
+    for x in range(point[0] - reach, point[0] + reach + 1):
+        for y in range(point[1] - reach, point[1] + reach + 1):
+            if (point[0]-x)**2 + (point[1]-y)**2 <= radius**2:
                 the_list.append((x,y))
     return the_list
 
 
 
-def create_overlap_lists(radius):
-        vals = {}
-        for i in range(-1,2):
-            for j in range(-1,2):
-                original = within_radius(radius, (0,0))
-                new = within_radius(radius, (i,j))
-                diffs = []
-                for nw in new:
-                    if nw not in original:
-                        diffs.append(nw)
-                vals[(i,j)] = diffs
+class OffsetTable:
+    """ The spots within a radius of a spot on a torus, as offsets, along
+    with the spots that come into and go out of range with each of the 9
+    possible moves. Offsets are wrapped (0 <= dx < max_x, 0 <= dy < max_y),
+    so a spot that can be reached around either side of the torus is only
+    listed once, however large the radius.
+    """
+
+    def __init__(self, radius, dimensions):
+        self.radius = radius
+        self.max_x = dimensions[0]
+        self.max_y = dimensions[1]
+
+        spots = set()
+        for dx, dy in within_radius(radius, (0,0)):
+            spots.add((dx % self.max_x, dy % self.max_y))
+        self.disc = numpy.array(sorted(spots), dtype=int).reshape(-1, 2)
+
+        # deltas[move] = (added, removed), as offsets from the new spot.
+        self.deltas = {}
+        for x_move in range(-1,2):
+            for y_move in range(-1,2):
+                was = set()
+                for dx, dy in spots:
+                    was.add(((dx - x_move) % self.max_x,
+                        (dy - y_move) % self.max_y))
+                added = numpy.array(sorted(spots - was),
+                    dtype=int).reshape(-1, 2)
+                removed = numpy.array(sorted(was - spots),
+                    dtype=int).reshape(-1, 2)
+                self.deltas[(x_move, y_move)] = (added, removed)
+
+
+    def spots(self, point, offsets=None):
+        """ The x and y arrays (from 1, like the locations) of the spots at
+        OFFSETS from POINT. By default, every spot in range.
+        """
+
+        if offsets is None:
+            offsets = self.disc
+        xs = (point[0] - 1 + offsets[:, 0]) % self.max_x + 1
+        ys = (point[1] - 1 + offsets[:, 1]) % self.max_y + 1
+        return xs, ys
+
+
+    def flat_spots(self, point, offsets=None):
+        """ Like spots(), but as indices into the flattened grid.
+        """
 
-        return vals
+        xs, ys = self.spots(point, offsets)
+        return (ys - 1) * self.max_x + (xs - 1)
 
 
 
@@ -42,7 +111,7 @@ class Space:
     """ The  grid the cells move around on.
     """
 
-    def __init__(self, cells, cell_radius, RNG, vision_radius, energy_costs, dimensions=(10,10), motion="Brownian"):
+    def __init__(self, cells, cell_radius, RNG, vision_radius, energy_costs, dimensions=(10,10), motion="Brownian", move_every=None):
     
         self.cells = cells
         # we control the random number generator to be able to reproduce runs.
@@ -58,10 +127,40 @@ class Space:
         self.rules = []
         self.energy_costs = energy_costs
         self.debug = None
+        self.verbose = True         # print the step count every 10000 steps
+        self.samplers = []          # see add_sampler()
+        self.next_sample = float("inf")
         self.neighbor_grid = numpy.empty(shape = (self.max_y, self.max_x), dtype = list)
+        for y in range(self.max_y):
+            for x in range(self.max_x):
+                self.neighbor_grid[y][x] = []
         self.change_vals = None
-        self.overlap_lists = create_overlap_lists(self.radius)
-        print "made overlap_lists"
+        self.grid_spots = self.neighbor_grid.ravel()     # same buckets, flat
+        self.offsets = get_offset_table(self.radius, dimensions)
+
+        # rule-weighted index for picking cells, kept current by the cells.
+        # Its order of the cells is also the order of the arrays below.
+        self.cell_index = AC_CellIndex.CellIndex(self.cells)
+        self.index_cells = self.cell_index.cells
+        self.positions = numpy.zeros((len(self.index_cells), 2), dtype=int)
+
+        # How many rules of each type there are over all the cells, kept
+        # current by update_rule_count(). Types only ever die out, and each
+        # time one does the space checks whether the run is absorbed (see
+        # get_absorbing_states()). ABSORBED is set to the reason once a
+        # reason in STOP_ON holds; runs stop there.
+        types = self.cells[0].urn.maxtype
+        self.type_counts = [[0] * (types+1) for i in range(types+1)]
+        self.input_totals = [0] * (types+1)
+        self.output_totals = [0] * (types+1)
+        for cl in self.cells:
+            for input, output, count in cl.get_rule_types():
+                self.type_counts[input][output] += count
+                self.input_totals[input] += count
+                self.output_totals[output] += count
+        self.stop_on = ()
+        self.absorbed = None
+        self.absorbed_at = None
 
         # A kludgy way to allow the cells to call Space functions.
         for cl in self.cells:
@@ -70,33 +169,40 @@ class Space:
         self.distribute_into_space(cells)
         print "distribute_into_space"
 
+        # synchronous motion draws its steps from its own stream, seeded
+        # from the main one.
+        self.motion = motion
+        self.move_every = move_every or len(self.cells)
+        self.next_move = float("inf")
+        self.motion_RNG = None
+        if motion == "synchronous":
+            self.motion_RNG = numpy.random.RandomState(
+                self.RNG.randint(0, 2**32 - 1))
+            self.next_move = self.master_count + self.move_every
 
-    def taurus_map(self, (new_x, new_y)):
-        """ A method the establishes the periodic boundary condition."""
-
-        if self.max_x < new_x:    
-            new_x = new_x - self.max_x
-        elif new_x < 1:
-            new_x = self.max_x + new_x
-
-        if self.max_y < new_y:
-            new_y = new_y - self.max_y
-        elif new_y < 1:
-            new_y = self.max_y + new_y
 
-        return new_x, new_y
+    def __getstate__(self):
+        # the flat view of the buckets and the shared offset table are
+        # made again when the space is loaded.
+        state = self.__dict__.copy()
+        del state["grid_spots"]
+        del state["offsets"]
+        return state
 
 
-    def map_list(self, loc, the_list):
+    def __setstate__(self, state):
+        state.pop("adjacency", None)     # kept by older checkpoints
+        self.__dict__.update(state)
+        self.grid_spots = self.neighbor_grid.ravel()
+        self.offsets = get_offset_table(self.radius,
+            (self.max_x, self.max_y))
 
-        new_list = []
 
-        for spot in the_list:
-            x = spot[0] + loc[0]
-            y = spot[1] + loc[1]
-            new_list.append(self.taurus_map((x, y)))
+    def taurus_map(self, (new_x, new_y)):
+        """ A method the establishes the periodic boundary condition. It
+        wraps however far off the grid the point is."""
 
-        return new_list
+        return (new_x - 1) % self.max_x + 1, (new_y - 1) % self.max_y + 1
 
 
     def distribute_into_space(self, cells):
@@ -113,35 +219,62 @@ class Space:
                 someone_here = self.is_some_one_here(x,y, self.cell_radius)
 
             cl.set_location(x,y)
-            try:
-                self.neighbor_grid[y-1][x-1].append(cl)
-            except:
-                self.neighbor_grid[y-1][x-1] = [cl]
-
-        #Setting up an initial list of neighbors    
-        for cl in self.cells:      
-            area = within_radius(self.radius, cl.get_location())
-            for point in area:
-                x, y = self.taurus_map(point)
-                try:
-                    cl.neighbors.extend(self.neighbor_grid[y-1][x-1])
-                except:
-                    pass
+            self.positions[self.cell_index.positions[cl]] = (x,y)
+            self.neighbor_grid[y-1][x-1].append(cl)
+
+        #Setting up an initial list of neighbors
+        self.rebuild_neighbors()
 
         #self.print_grid()
-    def is_some_one_here(self, x,y, cell_radius):
-        the_list = []
-        area = within_radius(cell_radius, (x, y))
-        for point in area:
-            x, y = self.taurus_map(point)
-            try:
-                the_list.extend(self.neighbor_grid[y-1][x-1])
-            except:
-                pass
 
-        if the_list == []:
-            return False
-        return True
+
+    def get_neighbors(self, i):
+        """ The places in the cell index of the cells within the vision
+        radius of cell I, in order, from the buckets in range of it. A cell
+        counts as its own neighbor.
+        """
+
+        positions = self.cell_index.positions
+        found = []
+        for spot in self.offsets.flat_spots(self.positions[i]).tolist():
+            for ngh in self.grid_spots[spot]:
+                found.append(positions[ngh])
+        found.sort()
+        return found
+
+
+    def rebuild_neighbors(self, places=None):
+        """ Works out the neighbors again from the positions for the cells
+        at PLACES (in order) in the cell index, by default all of them.
+        """
+
+        live = self.index_cells[0].productRule_Net.live
+        if places is None:
+            places = range(len(self.index_cells))
+
+        for i in places:
+            cl = self.index_cells[i]
+            old = cl.neighbors
+            cl.neighbors = AC_Cells.NeighborSet([self.index_cells[j]
+                for j in self.get_neighbors(i)])
+
+            # a live rule net has to follow the changes
+            if live:
+                for ngh in old:
+                    if ngh not in cl.neighbors and \
+                        self.cell_index.positions[ngh] > i:
+                        cl.productRule_Net.disconnect_cells(cl, ngh)
+                for ngh in cl.neighbors:
+                    if ngh not in old and self.cell_index.positions[ngh] > i:
+                        cl.productRule_Net.connect_cells(cl, ngh)
+
+
+    def is_some_one_here(self, x,y, cell_radius):
+        table = get_offset_table(cell_radius, (self.max_x, self.max_y))
+        for spot in table.flat_spots((x, y)):
+            if self.grid_spots[spot] != []:
+                return True
+        return False
 
 
     def print_grid(self):
@@ -177,61 +310,161 @@ class Space:
 
         current = cell.get_location()
 
-        # The boring essence of Brownian motion
-        someone_here = True
-        tries = 4
-        while someone_here and tries >= 1:
-            x_move =  self.RNG.randint(-1,1)
-            y_move =  self.RNG.randint(-1,1)
-            new_x, new_y = self.taurus_map((current[0] + x_move,
-                current[1] +  y_move))
-            someone_here = False #self.is_some_one_here(self.cell_radius, new_x, new_y)
-            tries -=1
+        # The boring essence of Brownian motion. Cells can share a spot, so
+        # there is no need to look for an empty one.
+        x_move =  self.RNG.randint(-1,1)
+        y_move =  self.RNG.randint(-1,1)
+        new_x, new_y = self.taurus_map((current[0] + x_move,
+            current[1] +  y_move))
 
         cell.set_location(new_x, new_y)
 
         self.update_grid(current, cell, x_move, y_move)
 
 
+    def move_all_cells(self):
+        """ Synchronous motion: every cell with rules takes a Brownian step
+        at the same time and then the neighbors are worked out again for
+        the cells that moved and the cells around where they were and
+        are."""
+
+        moves = self.motion_RNG.randint(-1, 2, size=self.positions.shape)
+        # cells without rules never get activated, so they stay put.
+        moves[numpy.array(self.cell_index.weights) <= 0] = 0
+        new = (self.positions - 1 + moves) % [self.max_x, self.max_y] + 1
+
+        moved = numpy.flatnonzero(moves.any(axis=1)).tolist()
+        for i in moved:
+            cl = self.index_cells[i]
+            old_x, old_y = self.positions[i]
+            x, y = new[i]
+            self.neighbor_grid[old_y-1][old_x-1].remove(cl)
+            self.neighbor_grid[y-1][x-1].append(cl)
+            cl.set_location(x, y)
+
+        # only these can have gained or lost a neighbor
+        positions = self.cell_index.positions
+        changed = set(moved)
+        for i in moved:
+            for point in [self.positions[i], new[i]]:
+                for spot in self.offsets.flat_spots(point).tolist():
+                    for ngh in self.grid_spots[spot]:
+                        changed.add(positions[ngh])
+
+        self.positions[:] = new
+        self.rebuild_neighbors(sorted(changed))
+        self.next_move = self.master_count + self.move_every
+
+
     def update_grid(self, old_spot, cell, x_move, y_move):
+        """ Moves the cell between buckets and updates its neighbors. Only
+        the spots that came into or went out of range with the move are
+        looked at, so the cost doesn't grow with the radius or the number
+        of cells."""
 
         new = cell.get_location()
         self.neighbor_grid[old_spot[1]-1][old_spot[0]-1].remove(cell)
-        try:
-            self.neighbor_grid[new[1]-1][new[0]-1].append(cell)
-        except:
-            self.neighbor_grid[new[1]-1][new[0]-1] = [cell]
-
-        
-        old_spots= self.map_list(cell.get_location(), 
-            self.overlap_lists[(-1*x_move, -1*y_move)])
-        #print old_spots
-
-        to_remove = []
-        for ngh in cell.neighbors:
-            if ngh.get_location() in old_spots:
+        self.neighbor_grid[new[1]-1][new[0]-1].append(cell)
+
+        i = self.cell_index.positions[cell]
+        self.positions[i] = new
+
+        added, removed = self.offsets.deltas[(x_move, y_move)]
+        positions = self.cell_index.positions
+        changed = []
+        for spot in self.offsets.flat_spots(new, removed).tolist():
+            for ngh in self.grid_spots[spot]:
+                if ngh in cell.neighbors:
+                    changed.append((positions[ngh], ngh))
+        for spot in self.offsets.flat_spots(new, added).tolist():
+            for ngh in self.grid_spots[spot]:
+                if ngh is not cell and ngh not in cell.neighbors:
+                    changed.append((positions[ngh], ngh))
+
+        # in the order of the cells, so runs don't depend on the buckets
+        changed.sort()
+        live = cell.productRule_Net.live
+        for j, ngh in changed:
+            if ngh in cell.neighbors:
                 ngh.neighbors.remove(cell)
-                #print "removed ", ngh.id, " at ", ngh.get_location()
-                to_remove.append(ngh)
-
-        for ngh in to_remove:
                 cell.neighbors.remove(ngh)
-        
-        new_spots = self.map_list(old_spot, 
-            self.overlap_lists[(x_move,y_move)])
-        #print new_spots
-        
-        for loc in new_spots:
-            try:
-                news = self.neighbor_grid[loc[1]-1][loc[0]-1]
-                for ngh in news:
-                    if ngh not in cell.neighbors:
-                        cell.neighbors.append(ngh)
-                        ngh.neighbors.append(cell)
-                        #print "added ", ngh.id, ngh.get_location()
-            except:
-                pass
-                #print "error:", self.neighbor_grid[loc[1]-1][loc[0]-1]
+                if live:
+                    cell.productRule_Net.disconnect_cells(cell, ngh)
+            else:
+                cell.neighbors.append(ngh)
+                ngh.neighbors.append(cell)
+                if live:
+                    cell.productRule_Net.connect_cells(cell, ngh)
+
+
+    def update_rule_count(self, cell, delta, rule=None):
+        """ Called by a cell whenever it gains or loses rules so that the
+        cell index and the counts of rule types stay in step with the cells'
+        rule counts."""
+
+        self.cell_index.add(cell, delta)
+
+        if rule is not None:
+            input, output = rule.key
+            self.type_counts[input][output] += delta
+            self.input_totals[input] += delta
+            self.output_totals[output] += delta
+            if delta < 0 and self.type_counts[input][output] == 0:
+                self.check_absorbed()
+
+
+    def get_absorbing_states(self):
+        """ The ways in which the rules have reached a state they can't
+        leave, judged from the rule types alone, since the cells keep moving:
+            "frozen"  - no rule's output is another rule's input, so nothing
+                        can reproduce and the rules never change again.
+            "acyclic" - the rule types don't form a cycle, and as types never
+                        come back, no autocatalytic cycle can form again.
+        """
+
+        states = []
+        types = range(1, len(self.input_totals))
+
+        compatible = False
+        for t in types:
+            if self.input_totals[t] > 0 and self.output_totals[t] > 0:
+                compatible = True
+                break
+        if not compatible:
+            states.append("frozen")
+
+        # peeling off types nothing leads into leaves the types on cycles
+        into = dict([(t, 0) for t in types])
+        for i in types:
+            for o in types:
+                if self.type_counts[i][o] > 0:
+                    into[o] += 1
+        free = [t for t in types if into[t] == 0]
+        while free:
+            i = free.pop()
+            del into[i]
+            for o in types:
+                if self.type_counts[i][o] > 0 and o in into:
+                    into[o] -= 1
+                    if into[o] == 0:
+                        free.append(o)
+        if into == {}:
+            states.append("acyclic")
+
+        return states
+
+
+    def check_absorbed(self):
+        """ Sets ABSORBED if the run is in a state it is asked to stop on.
+        """
+
+        if self.absorbed != None:
+            return
+        for state in self.get_absorbing_states():
+            if state in self.stop_on:
+                self.absorbed = state
+                self.absorbed_at = self.master_count
+                return
 
 
     def get_random_cell(self, who=None):
@@ -239,17 +472,26 @@ class Space:
         of rules it has. The who argument is used to prevent self
         pass backs in the non-spatial variant."""
 
-        candidates = []
-        cnts = []
-        for i in self.cells:
-            if i != who:
-                cnts.append(i.count_rules)
-                for j in range(i.count_rules):
-                        candidates.append(i)
+        return self.cell_index.get_random_cell(self.RNG, who)
 
-        return self.RNG.sample(candidates, 1)[0]
 
 
+    def add_sampler(self, sampler):
+        """ Adds an AC_Sampler.Sampler (or anything with a sample() method
+        and a next_sample step) to be called as the run goes."""
+
+        self.samplers.append(sampler)
+        self.next_sample = min([s.next_sample for s in self.samplers])
+
+
+    def take_samples(self):
+        """ Calls the samplers that are due."""
+
+        for sampler in self.samplers:
+            if self.master_count >= sampler.next_sample:
+                sampler.sample()
+        self.next_sample = min([s.next_sample for s in self.samplers])
+
 
     def activate_random_rule(self, debug=False):
         """A function to select a random rule from within a cell. It first
@@ -258,9 +500,15 @@ class Space:
 
         candidate = self.get_random_cell()
         candidate.set_active_rule(candidate.get_random_rule())
-        self.move_cell(candidate)
+        if self.motion_RNG is None:
+            self.move_cell(candidate)
         candidate.chain_step(debug)
 
+        if self.master_count >= self.next_move:
+            self.move_all_cells()
+        if self.master_count >= self.next_sample:
+            self.take_samples()
+
 
     def activate_random_cell(self, debug=False):
         """A function to select a random rule from within a cell. It first
@@ -268,7 +516,8 @@ class Space:
         a rule from that cell, weighted by the rules' frequencies."""
 
         candidate = self.get_random_cell()
-        self.move_cell(candidate)
+        if self.motion_RNG is None:
+            self.move_cell(candidate)
         has = candidate.has_Product()
         if has != None:
             candidate.set_active_rule(candidate.get_random_rule_of_type(has))
@@ -277,6 +526,9 @@ class Space:
             candidate.set_active_rule(candidate.get_random_rule())
             candidate.chain_step(debug)
 
+        if self.master_count >= self.next_move:
+            self.move_all_cells()
+
 
     def remove_random_rule(self):
         """This method is the main way in which selection pressure is
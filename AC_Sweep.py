@@ -0,0 +1,156 @@
+""" This module runs the parameter sweep behind plotter.py. Every
+combination of product types, urn and reproduction type gets RUNS headless
+runs, spread over a pool of processes. Each run's seed is derived from the
+sweep seed, the configuration and the run number, so any single run can
+be replayed on its own. Results are appended to the same CSV files
+print_data() writes, and runs already in a file are skipped, so an
+interrupted sweep picks up where it stopped. With CHECKPOINT_EVERY, runs in
+progress are saved as they go and resumed from there as well. The workers
+also append each run to NAME.rec in the binary format of AC_Results. With
+KERNEL the runs take their steps through AC_Kernel wherever they can,
+which gives the same runs much faster.
+
+
+Written by Jon Atwell
+"""
+
+import AC_Headless
+import AC_Random
+import AC_Results
+import multiprocessing
+import os
+import sys
+
+
+PRODUCT_TYPES = [2,3,4,5,6,7,8,9]
+CHEMISTRY = ["ALL"] # "SOLOH"
+INTEL_TYPE = [False] # => "selective"
+URN_TYPE = ["fixed-rich-target","fixed-poor-target", "fixed-rich-source","fixed-poor-source", "endo-rich-source","endo-poor-source"]
+TOPOLOGY = ["spatial"] # "well-mixed"
+RUNS = 100
+SEED = 0
+RECORDS = True # also write NAME.rec
+RNG_STREAMS = False # a stream per subsystem, see AC_Random
+RNG_BLOCK = None # draw the streams in blocks of this many
+CHECKPOINT_EVERY = None # save runs in progress to NAME-RUN.ckpt this often
+ADAPTIVE = False # end runs once they converge, see AC_Convergence
+KERNEL = True # take the steps with AC_Kernel where the run allows it
+
+
+def get_run_seed(sweep_seed, name, count_run):
+    """ A seed for a single run that only depends on the sweep seed, the
+    configuration name and the run number.
+    """
+
+    return AC_Random.derive_seed(sweep_seed, name, count_run)
+
+
+def get_finished_runs(name):
+    """ The run numbers already written to NAME.csv.
+    """
+
+    finished = set()
+    if os.path.exists(name+".csv"):
+        datafile = open(name+".csv", "r+")
+        lines = datafile.readlines()
+
+        # a line cut short by an interruption is dropped from the file
+        if lines != [] and not lines[-1].endswith("\n"):
+            datafile.seek(0)
+            datafile.truncate(sum([len(line) for line in lines[:-1]]))
+            lines = lines[:-1]
+        datafile.close()
+
+        for line in lines:
+            try:
+                finished.add(int(line.split(",")[0]))
+            except ValueError:
+                pass
+    return finished
+
+
+def get_jobs(runs=RUNS, sweep_seed=SEED):
+    """ Every (name, run, parameters, seed) in the sweep that hasn't been
+    written yet.
+    """
+
+    jobs = []
+    for TYPES in PRODUCT_TYPES:
+        for CHEM in CHEMISTRY:
+            for INTEL in INTEL_TYPE:
+                for URN_REPRO in URN_TYPE:
+                    URN, REPRO = URN_REPRO.rsplit("-", 1)
+                    for TOPO in TOPOLOGY:
+                        name = AC_Headless.get_name(TYPES, URN, REPRO, CHEM,
+                            INTEL, TOPO)
+                        finished = get_finished_runs(name)
+                        for count_run in range(runs):
+                            if count_run not in finished:
+                                seed = get_run_seed(sweep_seed, name,
+                                    count_run)
+                                jobs.append((name, count_run, (TYPES, URN,
+                                    REPRO, CHEM, INTEL, TOPO), seed))
+    return jobs
+
+
+def run_job(job):
+    """ Runs one job in a worker process, appends its record and hands back
+    the line for the CSV file.
+    """
+
+    name, count_run, (TYPES, URN, REPRO, CHEM, INTEL, TOPO), seed = job
+
+    # a run that was stopped part way picks up from its checkpoint
+    checkpoint = "%s-%d.ckpt" %(name, count_run)
+    if CHECKPOINT_EVERY != None and os.path.exists(checkpoint):
+        model = AC_Headless.load_checkpoint(checkpoint)
+    else:
+        model = AC_Headless.HeadlessModel(TYPES, URN, REPRO, seed, CHEM,
+            INTEL, TOPO, verbose=False, rng_streams=RNG_STREAMS,
+            rng_block=RNG_BLOCK, adaptive=ADAPTIVE)
+    model.run(checkpoint_every=CHECKPOINT_EVERY, checkpoint_file=checkpoint,
+        kernel=KERNEL)
+
+    results = model.get_results(count_run)
+    if RECORDS:
+        AC_Results.append_records(name+".rec",
+            AC_Results.make_record(results))
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return name, count_run, model.get_data(count_run, results)
+
+
+def run_sweep(runs=RUNS, processes=None, sweep_seed=SEED):
+    """ Runs everything left in the sweep. Lines are written as runs finish,
+    so only the runs in progress are lost if the sweep is stopped.
+    """
+
+    jobs = get_jobs(runs, sweep_seed)
+    print "%d runs to go" %len(jobs)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for name, count_run, data in pool.imap_unordered(run_job, jobs):
+            output_file = open(name+".csv", "a+")
+            output_file.write(data)
+            output_file.close()
+            print name, count_run
+        pool.close()
+    except BaseException:
+        # an interruption, or a run that failed in a worker
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+
+if __name__ == "__main__":
+    # python AC_Sweep.py [RUNS] [PROCESSES] [SEED]
+
+    args = sys.argv[1:] + [None] * 3
+    runs = int(args[0] or RUNS)
+    processes = args[1] and int(args[1])
+    sweep_seed = int(args[2] or SEED)
+
+    run_sweep(runs, processes, sweep_seed)
@@ -0,0 +1,227 @@
+""" This module runs a model in the background for the visual version. The
+windows used to take steps from a pyglet clock callback, a fixed number per
+tick, so the model went as fast as the frames did and the windows stopped
+answering while it worked. A Worker is a thread that runs the model
+as fast as it goes (through AC_Kernel when the run allows it) and every
+INTERVAL seconds publishes a Snapshot of what the windows show: where the
+cells are, which are alive, their rules and stored products, the urn and
+the step count.
+
+Snapshots go through a DoubleBuffer. The worker writes the one the windows
+aren't looking at and then swaps them, and the windows copy out the one in
+front and check that it wasn't written over while they copied. Neither
+side ever waits on a lock. Nothing but the worker touches the model while
+it runs; it takes the cells' Sprites away until it is stopped, so the
+Sprites are only ever moved by the windows.
+
+
+Written by Jon Atwell
+"""
+
+import AC_Kernel
+import numpy
+import threading
+import time
+
+
+class Snapshot:
+    """ What the windows need to know about a run at one moment, for
+    COUNT_CELLS cells and product types up to TYPES. Arrays are indexed by
+    the cells' place in the space's cell index.
+    """
+
+    def __init__(self, count_cells, types):
+        S = types + 1
+        self.version = 0        # odd while the snapshot is being written
+        self.master_count = 0
+        self.absorbed = None
+        self.positions = numpy.zeros((count_cells, 2), dtype=int)
+        self.alive = numpy.zeros(count_cells, dtype=bool)
+        self.cell_rules = numpy.zeros(count_cells, dtype=int)
+        self.rules = numpy.zeros((count_cells, S, S), dtype=int)
+        self.stored = numpy.zeros((count_cells, S), dtype=int)
+        self.urn = numpy.zeros(S, dtype=int)
+
+
+    def copy_to(self, other):
+        """ Copies this snapshot into OTHER, version and all.
+        """
+
+        other.version = self.version
+        other.master_count = self.master_count
+        other.absorbed = self.absorbed
+        for name in ["positions", "alive", "cell_rules", "rules", "stored",
+            "urn"]:
+            numpy.copyto(getattr(other, name), getattr(self, name))
+
+
+    def fill_from_space(self, space):
+        """ Takes the state from the objects of SPACE.
+        """
+
+        cells = space.index_cells
+        self.master_count = space.master_count
+        self.absorbed = space.absorbed
+        self.positions[:] = space.positions
+        self.cell_rules[:] = space.cell_index.weights
+        for c, cell in enumerate(cells):
+            self.alive[c] = cell.isAlive
+            self.rules[c] = cell.rule_counts
+            self.stored[c] = 0
+            for t, products in cell.products.items():
+                self.stored[c, t] = len(products)
+        self.urn[:] = cells[0].urn.counts
+
+
+    def fill_from_kernel(self, kernel):
+        """ Takes the state from the packed state of an AC_Kernel.Kernel.
+        """
+
+        shape = self.rules.shape
+        self.master_count = int(kernel.counters[0])
+        self.absorbed = kernel.space.absorbed
+        self.positions[:, 0] = kernel.px
+        self.positions[:, 1] = kernel.py
+        self.alive[:] = kernel.alive
+        self.cell_rules[:] = kernel.cell_rules
+        self.rules[:] = numpy.reshape(kernel.rules, shape)
+        self.stored[:] = numpy.reshape(kernel.size, shape[:2])
+        self.urn[:] = kernel.urn_counts
+
+
+
+class DoubleBuffer:
+    """ Two Snapshots, one in front for the readers and one in the back
+    for the writer. There is only ever one writer.
+    """
+
+    def __init__(self, count_cells, types):
+        self.snapshots = [Snapshot(count_cells, types),
+            Snapshot(count_cells, types)]
+        self.front = 0
+
+
+    def publish(self, fill):
+        """ Fills the back snapshot with FILL(snapshot) and brings it to the
+        front.
+        """
+
+        back = self.snapshots[1 - self.front]
+        back.version += 1
+        fill(back)
+        back.version += 1
+        self.front = 1 - self.front
+
+
+    def read(self, into):
+        """ Copies the front snapshot into the Snapshot INTO, again if the
+        writer got to it while it was being copied.
+        """
+
+        while True:
+            snapshot = self.snapshots[self.front]
+            version = snapshot.version
+            if version % 2 == 0:
+                snapshot.copy_to(into)
+                if snapshot.version == version:
+                    return into
+            time.sleep(0)
+
+
+
+class Worker(threading.Thread):
+    """ Runs the HeadlessModel MODEL up to STEPS steps (or until it is
+    absorbed or converges) in CHUNK step pieces, publishing a Snapshot to
+    BUFFER at most every INTERVAL seconds. With COMPILED the kernel is
+    compiled if Numba is installed, see AC_Kernel.
+    """
+
+    def __init__(self, model, steps, compiled=True, chunk=2000,
+        interval=1/30.):
+        threading.Thread.__init__(self, name="AC_Worker")
+        self.daemon = True
+        self.model = model
+        self.steps = steps
+        self.compiled = compiled
+        self.chunk = chunk
+        self.interval = interval
+        self.going = threading.Event()      # cleared while paused
+        self.going.set()
+        self.stopping = False
+        self.finished = False
+
+        space = model.space
+        self.buffer = DoubleBuffer(len(space.index_cells),
+            model.urn.maxtype)
+        self.buffer.publish(lambda snapshot: snapshot.fill_from_space(space))
+
+        # the windows move the Sprites from the snapshots from now on
+        self.sprites = []
+        for cell in space.index_cells:
+            self.sprites.append(cell.Sprite)
+            cell.Sprite = None
+
+
+    def run(self):
+        model = self.model
+        space = model.space
+
+        kernel = None
+        if model.monitor == None and space.absorbed == None and \
+            AC_Kernel.get_unsupported(space) == None:
+            kernel = AC_Kernel.Kernel(space, compiled=self.compiled)
+            fill = lambda snapshot: snapshot.fill_from_kernel(kernel)
+        else:
+            fill = lambda snapshot: snapshot.fill_from_space(space)
+
+        published = time.time()
+        while not self.stopping:
+            if not self.going.wait(self.interval):
+                continue
+
+            if kernel != None:
+                count = kernel.run(min(kernel.counters[0] + self.chunk,
+                    self.steps))
+            else:
+                count = model.run(min(space.master_count + self.chunk,
+                    self.steps))
+            done = count >= self.steps or space.absorbed != None or \
+                model.is_converged()
+
+            if done or time.time() - published >= self.interval:
+                self.buffer.publish(fill)
+                published = time.time()
+            if done:
+                break
+
+        if kernel != None:
+            kernel.sync()
+        self.buffer.publish(lambda snapshot: snapshot.fill_from_space(space))
+        self.finished = True
+
+
+    def pause(self):
+        self.going.clear()
+
+
+    def resume(self):
+        self.going.set()
+
+
+    def is_paused(self):
+        return not self.going.is_set()
+
+
+    def stop(self):
+        """ Stops the run, waits for the thread to finish and gives the
+        cells their Sprites back. Called from the thread that made it.
+        """
+
+        self.stopping = True
+        self.going.set()
+        if self.is_alive():
+            self.join()
+        for cell, sprite in zip(self.model.space.index_cells, self.sprites):
+            cell.Sprite = sprite
+            x, y = cell.get_location()
+            cell.set_location(x, y)
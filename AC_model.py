@@ -14,6 +14,9 @@ import AC_ProductRuleNet
 import AC_Cells 
 import AC_Space
 import AC_grapher
+import AC_Headless
+import AC_Worker
+from AC_Headless import get_step_count
 import random
 import networkx as nx
 import sys
@@ -35,9 +38,6 @@ class control_Sprite(pyg.sprite.Sprite):
         control_window.push_handlers(self.on_mouse_press)
 
     def on_mouse_press(self, x, y, button, modifiers):
-        global action_scheduled
-        global action_rate
-        global product_bars_data
         anchor = self.position
 
         # now we'll get the visual center
@@ -50,24 +50,34 @@ class control_Sprite(pyg.sprite.Sprite):
 
         if dis <= rad:
             if self.name == "pause":
-                pyg.clock.unschedule(cell_action)
-                pyg.clock.unschedule(update_product_count)
-                action_scheduled = False
+                worker.pause()
             elif self.name == "play": 
-                if not action_scheduled:
-                    pyg.clock.schedule_interval(cell_action, action_rate)
-                    pyg.clock.schedule_interval(update_product_count, 1, product_bars_data, 255)
-                    action_scheduled = True
+                worker.resume()
             elif self.name == "stop":
                 pyg.app.exit()
 
 
+class line_Group(graphics.OrderedGroup):
+    """ Draws the lines in it WIDTH pixels wide, so the axes can go in the
+    same batch as the bars."""
+
+    def __init__(self, order, width):
+        graphics.OrderedGroup.__init__(self, order)
+        self.width = width
+
+    def set_state(self):
+        pyg.gl.glLineWidth(self.width)
+
+    def unset_state(self):
+        pyg.gl.glLineWidth(1)
+
+
 class cell_Sprite(pyg.sprite.Sprite):
 
-    def __init__(self, cell_image, batch, name):
+    def __init__(self, cell_image, batch, group, name):
         self.cell = None
         self.name = name
-        pyg.sprite.Sprite.__init__(self, cell_image, batch=batch)
+        pyg.sprite.Sprite.__init__(self, cell_image, batch=batch, group=group)
         main_window.push_handlers(self.on_mouse_press)
 
     def add_cell(self, cell):
@@ -93,22 +103,27 @@ class cell_Sprite(pyg.sprite.Sprite):
 
         if dis <= rad:
             # We now have the one cell that was clicked and we add the label
-            lbl = pyg.text.Label(str(self.name), x=center[0]-6, y=center[1]-6, color=(0,0,0,150))
-            cell_labels_list[0] = lbl
-
-            # We also schedule to remove the label in 1 seconds.
-            pyg.clock.schedule_once(remove_label, 2, lbl)
-
-            
+            cell_label.begin_update()
+            cell_label.text = str(self.name)
+            cell_label.x = center[0]-6
+            cell_label.y = center[1]-6
+            cell_label.end_update()
+
+            # We also schedule to remove the label in 2 seconds.
+            pyg.clock.unschedule(remove_label)
+            pyg.clock.schedule_once(remove_label, 2)
+
+            # The cell itself belongs to the worker, so what we show
+            # comes from the latest snapshot.
+            c = myspace.cell_index.positions[self.cell]
             rule_str = []
             total_rules = 0
-            for input_key in self.cell.product_rules.keys():
-                for output_key in self.cell.product_rules[input_key].keys():
-                    rls = len(self.cell.product_rules[input_key][output_key])
-                    total_rules += rls
-                    rule_str.append(str(input_key) +"->" + str(output_key)+ ": " + str(rls))
+            for input_key, output_key in zip(*shown.rules[c].nonzero()):
+                rls = shown.rules[c, input_key, output_key]
+                total_rules += rls
+                rule_str.append(str(input_key) +"->" + str(output_key)+ ": " + str(rls))
 
-            data_labels_list[0] = pyg.text.Label("Cell: " + str(self.name) + "  # rules: " +str(total_rules), x=5, y=75,color=(0,0,0,150))
+            data_labels_list[0].text = "Cell: " + str(self.name) + "  # rules: " +str(total_rules)
 
             dataA = []
             dataB = []
@@ -129,42 +144,19 @@ class cell_Sprite(pyg.sprite.Sprite):
             except :
                 rule_strB = " "
 
-            data_labels_list[1] = pyg.text.Label(rule_strA, x=5, y=55,color=(0,0,0,150))
-            data_labels_list[2] = pyg.text.Label(rule_strB, x=5, y=35,color=(0,0,0,150))
+            data_labels_list[1].text = rule_strA
+            data_labels_list[2].text = rule_strB
             hld = ""
-            for i in self.cell.products.keys():
-                cnt = len(self.cell.products[i])
+            for i in range(len(shown.stored[c])):
+                cnt = shown.stored[c, i]
                 if cnt != 0:
                     hld += (str(i) + ": " + str(cnt) + "  ")
 
-            data_labels_list[3] = pyg.text.Label("Storage - "+ hld, x=5, y=15,color=(0,0,0,150))
+            data_labels_list[3].text = "Storage - "+ hld
             
  
          
 
-def get_step_count(PRODUCT_TYPES):
-    """A utility function to determine how long to run the model.
-    """
-
-    STEPS = 270000
-    
-    if PRODUCT_TYPES == 3:
-        STEPS = 410000
-    elif PRODUCT_TYPES == 4:
-        STEPS = 580000
-    elif PRODUCT_TYPES == 5:
-        STEPS = 770000
-    elif PRODUCT_TYPES == 6:
-        STEPS = 980000
-    elif PRODUCT_TYPES == 7:
-        STEPS = 1210000
-    elif PRODUCT_TYPES == 8:
-        STEPS = 1460000
-    elif PRODUCT_TYPES == 9:
-        STEPS = 1720000
-                         
-    return STEPS
-    
 def get_parameters():
     print "Please input the run parameters."
     captured = False
@@ -228,22 +220,7 @@ def print_data(name, myspace, myRuleNet, cells):
 
     #Creating a network object for compatible rules
         myRuleNet = AC_ProductRuleNet.ProductRuleNet()
-
-        for cell in cells:
-            for inpt in cell.product_rules.keys():
-                for otpt in cell.product_rules[inpt].keys():
-                    cell.add_ProductNetRule(
-                        cell.product_rules[inpt][otpt][0])
-
-    #Filling in the actual compatible rule network. 
-        for cell in cells:
-            if cell.product_netrules.values() != {}:
-                for ngh in cell.neighbors:
-                    if ngh.product_netrules.values() != {}:
-                        for r1 in cell.product_netrules.values():
-                            for r2 in ngh.product_netrules.values():
-                                # check of compatibility in funct.
-                                myRuleNet.add_edge(r1,r2) 
+        myRuleNet.build(cells)
 
         myRuleNet.net.edges()
         myRuleNet.update_cycle_counts(myspace.master_count)
@@ -312,7 +289,6 @@ print name
 
 # as rng to reproduce runs if desired
 seed = random.randint(0,sys.maxint)
-RNG = random.Random(seed)
 
 window_width = 700
 window_height = 700
@@ -351,16 +327,30 @@ pyg.gl.glClearColor(.85, .85, .85, .2)
 
 
 STEPS = 0
+
+# Everything a window shows is kept in one batch per window and changed in
+# place, so each window is a single draw however many cells there are.
 cell_batch = graphics.Batch()
-product_label_batch = graphics.Batch()
+product_batch = graphics.Batch()
 rule_bar_batch = graphics.Batch()
 control_batch = graphics.Batch()
 data_batch = graphics.Batch()
 
+back_group = graphics.OrderedGroup(0)
+axis_group = line_Group(1, 3)
+front_group = graphics.OrderedGroup(2)
+
 cell_list = []
-hld = pyg.text.Label(" ", x=5, y=55, color=(0,0,0,150))
-cell_labels_list = [hld]
-data_labels_list = [hld, hld, hld, hld]
+steps_label = pyg.text.Label("Steps:  0", x=2, y=2, color=(0,0,0,150), font_size=20, bold=True, batch=cell_batch, group=front_group)
+cell_label = pyg.text.Label("", x=5, y=55, color=(0,0,0,150), batch=cell_batch, group=front_group)
+data_labels_list = []
+for y in [75, 55, 35, 15]:
+    data_labels_list.append(pyg.text.Label("", x=5, y=y, color=(0,0,0,150), batch=data_batch))
+
+for batch in [rule_bar_batch, product_batch]:
+    batch.add(4, pyg.gl.GL_LINES, axis_group,
+        ('v2f/static', (10.,30., 380., 30., 10.,29., 10., 255.)),
+        ('c3B/static', (0,0,0) * 4))
 
 control_list = []
 
@@ -371,53 +361,26 @@ control_list.append(control_Sprite(image.load("play.png"), x=-5, y=35,scale=.5,
 @main_window.event
 def on_draw():
     main_window.clear()
-    steps = pyg.text.Label("Steps:  " + str(myspace.master_count), x=2, y=2, color=(0,0,0,150), font_size=20, bold=True)
-    steps.draw()
-    for i in cell_list:
-        i.draw()
-        if i.cell.isAlive == False:
-            cell_list.remove(i)
-            i.delete
-            i.x = 0
-            print i.cell.id, " died"
-            cells.remove(i.cell)
-    for i in cell_labels_list:
-        i.draw()
+    cell_batch.draw()
 
 
 @rule_plot_window.event
 def on_draw():
     rule_plot_window.clear()
-    for bar in rule_bars:
-        graphics.glColor3f(0, 0, 255)
-        graphics.draw(4, pyg.gl.GL_QUADS, ('v2f', bar))
-
-    graphics.glColor3f(0, 0, 0)
-    graphics.glLineWidth(3)
-    graphics.draw(2, pyg.gl.GL_LINES, ('v2f', (10.,30., 380., 30.)))
-    graphics.draw(2, pyg.gl.GL_LINES, ('v2f',(10.,29., 10., 255)))
+    rule_bar_batch.draw()
 
 
 @product_plot_window.event
 def on_draw():
     product_plot_window.clear()
-    for bar in product_bars:
-        graphics.glColor3f(0, 0, 255)
-        graphics.draw(4, pyg.gl.GL_QUADS, ('v2f', bar))
-
-    graphics.glColor3f(0, 0, 0)
-    graphics.glLineWidth(3)
-    graphics.draw(2, pyg.gl.GL_LINES, ('v2f', (10.,30., 380., 30.)))
-    graphics.draw(2, pyg.gl.GL_LINES, ('v2f',(10.,29., 10., 255)))
-    product_label_batch.draw()
+    product_batch.draw()
     
 
 
 @data_window.event
 def on_draw():
     data_window.clear()
-    for i in data_labels_list:
-       i.draw()
+    data_batch.draw()
 
 
 
@@ -433,123 +396,177 @@ def on_close():
 
 
 
+def make_bar(batch):
+    """ A flat bar in BATCH, with a vertex list of its own so it can be
+    changed without touching the others."""
+
+    return batch.add(4, pyg.gl.GL_QUADS, back_group,
+        ('v2f/stream', [0.] * 8), ('c3B/static', (0,0,255) * 4))
+
+
+def get_bar(points, height):
+    """ The corners of a bar between POINTS reaching HEIGHT above the axis."""
+
+    return (points[0], 30., points[1], 30., points[1], 
+        height+30., points[0], height+30.)
+
+
 def update_product_count(inc, product_bars_data, max_prod_height):
-    
+    """ Redraws the bars of the product types whose counts in the urn have
+    changed since they were last plotted, and the circulating bar with
+    them."""
 
-    run_count = 0
-    prods = len(product_bars_data)
-    for index, product, points in product_bars_data:
-        if index < prods-1:
-            count = float(len(myurn.collection[product]))
-            height = (count/200.) * max_prod_height
-
-            product_bars[index]= (points[0], 30., points[1], 30., points[1], 
-                height+30., points[0], height+30.)
-            run_count += count
-        else:
-            height = ((200-run_count)/200.) * max_prod_height
-            product_bars[index]= (points[0], 30., points[1], 30., points[1], 
-                height+30., points[0], height+30.)
+    changed = (shown.urn != plotted.urn).nonzero()[0]
+    if len(changed) == 0:
+        return
 
+    prods = len(product_bars_data)
+    for t in changed:
+        if 0 < t < prods:
+            index, product, points = product_bars_data[t-1]
+            height = (shown.urn[product]/200.) * max_prod_height
+            product_bars[index].vertices[:] = get_bar(points, height)
 
-def update_rule_count(inc,max_prod_height):
-    global rule_bars
-    rule_bars=[]
-    count_cells = len(cells)
-    width_space = 370/((count_cells + 1)  + (2 * count_cells))
-    for i, cell in enumerate(cells):
-            count = cell.count_rules
-            points = ((width_space+10 + (i * 3 * width_space), width_space +10 + (i*3*width_space) + (2 * width_space)))
-            height = (count/200.) * max_prod_height
-            rule_bars.append((points[0], 30., points[1], 30., points[1], 
-                height+30., points[0], height+30.))
+    index, product, points = product_bars_data[prods-1]
+    height = ((200-float(shown.urn.sum()))/200.) * max_prod_height
+    product_bars[index].vertices[:] = get_bar(points, height)
+    plotted.urn[:] = shown.urn
 
 
-def cell_action(inc):
-    n = int(1/float(inc))*10
-    for i in range(n):
-        myspace.activate_random_rule()
-    if myspace.master_count > TOTAL_STEPS:
-        pyg.clock.unschedule(cell_action)
-        pyg.clock.unschedule(update_product_count)
-        action_scheduled = False
+def update_rule_count(inc,max_prod_height):
+    """ Redraws the bars of the cells whose rule counts have changed since
+    they were last plotted. The bars are spread over the living cells, so
+    when a cell dies they are all redrawn."""
+
+    global rule_slots, rule_width
+    if (shown.alive != plotted.alive).any():
+        count_cells = int(shown.alive.sum())
+        rule_width = 370/((count_cells + 1)  + (2 * count_cells))
+        rule_slots = shown.alive.cumsum() - 1
+        changed = range(len(rule_bars))
+    else:
+        changed = (shown.cell_rules != plotted.cell_rules).nonzero()[0]
 
+    width_space = rule_width
+    for c in changed:
+        if shown.alive[c]:
+            i = rule_slots[c]
+            points = ((width_space+10 + (i * 3 * width_space), width_space +10 + (i*3*width_space) + (2 * width_space)))
+            height = (shown.cell_rules[c]/200.) * max_prod_height
+            rule_bars[c].vertices[:] = get_bar(points, height)
+        else:
+            rule_bars[c].vertices[:] = [0.] * 8
+    plotted.alive[:] = shown.alive
+    plotted.cell_rules[:] = shown.cell_rules
 
-def remove_label(time, label):
 
-    cell_labels_list[0] = hld = pyg.text.Label(" ")
+def refresh(inc):
+    """ Takes the latest snapshot from the worker and moves the cells'
+    Sprites to match. The model itself runs in the worker's thread, and
+    only the Sprites of cells that moved, changed or died are touched."""
 
+    worker.buffer.read(shown)
+    changed = (shown.positions != drawn.positions).any(axis=1) | \
+        (shown.cell_rules != drawn.cell_rules) | (shown.alive != drawn.alive)
+    for i in changed.nonzero()[0]:
+        sprite = cell_list[i]
+        cell = sprite.cell
+        x, y = shown.positions[i]
+        sprite.position = ((x-1) * cell.scaling_x + cell.border_size,
+            (y-1) * cell.scaling_y + cell.border_size)
+        sprite.color = (150,int(shown.cell_rules[i]*255/200.),150)
+        if sprite.visible and not shown.alive[i]:
+            sprite.visible = False
+            print cell.id, " died"
 
-#Setting up the environment including the products
-myurn = AC_Products.Urn(URN+"-"+REPRO, TYPES, RNG,INITIAL_ENERGY, 
-    PRODUCT_COUNT)
+    if shown.master_count != drawn.master_count:
+        steps_label.text = "Steps:  " + str(shown.master_count)
+    shown.copy_to(drawn)
 
-# Creating all of the rules 
-myrules = AC_ProductRules.create_RuleSet(CHEM,TYPES, RULE_COUNT, RNG)
 
-#Creating a network object for compatible rules
-myRuleNet = AC_ProductRuleNet.ProductRuleNet()
+def remove_label(time):
 
+    cell_label.text = ""
 
 
 # creating the actual cells with Sprites
 cell_image = image.load("cell.png")
-cells = []
 cell_radius = .005
-for i in range(20):
-    sprite = cell_Sprite(cell_image,cell_batch, str(i+1))
+
+def make_cell_Sprite(i):
+    sprite = cell_Sprite(cell_image,cell_batch, back_group, str(i+1))
     sprite.scale = 3./ (space_width)
     sprite.color = (150,150,150)
     cell_list.append(sprite)
-    new_cell = AC_Cells.Cell(myurn, myRuleNet, RNG, i+1, sprite, (window_width, window_height), (space_width, space_height), border_size, INTEL, REPRO, TOPO, RADIUS)
-    cells.append(new_cell)
+    return sprite
+
+# The urn, rules, cells and space are built the same way as in headless runs
+model = AC_Headless.HeadlessModel(TYPES, URN, REPRO, seed, CHEM, INTEL, TOPO,
+    cell_count=20, product_count=PRODUCT_COUNT, rule_count=RULE_COUNT,
+    energy_costs=ENERGY_COSTS, initial_energy=INITIAL_ENERGY, radius=RADIUS,
+    cell_radius=cell_radius, dimensions=(space_width, space_height),
+    screen_dimensions=(window_width, window_height),
+    sprite_factory=make_cell_Sprite)
+
+RNG = model.RNG
+myurn = model.urn
+myRuleNet = model.rulenet
+cells = model.cells
+myspace = model.space
+
+for sprite, new_cell in zip(cell_list, cells):
     sprite.add_cell(new_cell)
 
 print "made cells"
-#passing out the myrules to cells at random
-for i in range(len(myrules)):
-    cell = RNG.choice(cells)
-    cell.add_ProductRule(myrules.pop(0))
-
-
-# Creating a network of neighbors on torus grid
-myspace= AC_Space.Space(cells, cell_radius, RNG, RADIUS, ENERGY_COSTS, dimensions=(space_width, space_height) )
-
-
 
 
 print "Running the first %d steps headless . . . " %non_viz_steps
-while myspace.master_count < non_viz_steps:
-    myspace.activate_random_rule()
+model.warm_up(non_viz_steps)
 
 
 TOTAL_STEPS = get_step_count(TYPES)
-pyg.clock.schedule_interval(cell_action, action_rate)
-action_scheduled = True
+
+# The rest of the run goes on in its own thread, as fast as it can, and the
+# windows show the latest snapshot of it every action_rate seconds.
+worker = AC_Worker.Worker(model, TOTAL_STEPS)
+shown = AC_Worker.Snapshot(len(cells), TYPES)
+drawn = AC_Worker.Snapshot(len(cells), TYPES)  # what the Sprites show
+drawn.positions[:] = -1
+plotted = AC_Worker.Snapshot(len(cells), TYPES)  # what the bars show
+plotted.cell_rules[:] = -1
+plotted.urn[:] = -1
+worker.buffer.read(shown)
+worker.start()
+pyg.clock.schedule_interval(refresh, action_rate)
 
 # Setting up the bars for plotting product counts
-count_products = len(myurn.collection.keys()) + 1
+count_products = len(myurn.get_types()) + 1
 width_space = 370/((count_products + 1)  + (2 * count_products))
-product_bars = [(0.,0.,0.,0.,0.,0.,0.,0.) for i in range(count_products)]
-rule_bars=[]
+product_bars = [make_bar(product_batch) for i in range(count_products)]
+rule_bars = [make_bar(rule_bar_batch) for cell in cells]
+rule_slots = None
+rule_width = 0
 product_bars_data = []
 
 for i in range(count_products):
     product_bars_data.append((i, i+1, (width_space + (i * 3 * width_space), width_space + (i*3*width_space) + (2 * width_space))))
     if i < count_products - 1:
-        pyg.text.Label(str(i+1), x=(width_space*1.75 + (i * 3 * width_space)), y=5, color=(0,0,0,150), font_size=15, bold=True, batch=product_label_batch)
+        pyg.text.Label(str(i+1), x=(width_space*1.75 + (i * 3 * width_space)), y=5, color=(0,0,0,150), font_size=15, bold=True, batch=product_batch, group=front_group)
     else:
-        pyg.text.Label("Circ.", x=(width_space*1.1 + (i * 3 * width_space)), y=5, color=(0,0,0,150), font_size=15, bold=True, batch=product_label_batch)
-pyg.text.Label("-200", x=9, y=249, color=(0,0,0,150), font_size=15, bold=True, batch=product_label_batch)
+        pyg.text.Label("Circ.", x=(width_space*1.1 + (i * 3 * width_space)), y=5, color=(0,0,0,150), font_size=15, bold=True, batch=product_batch, group=front_group)
+pyg.text.Label("-200", x=9, y=249, color=(0,0,0,150), font_size=15, bold=True, batch=product_batch, group=front_group)
 
 
 pyg.clock.schedule_interval_soft(update_product_count, 1, product_bars_data, 225)
 pyg.clock.schedule_interval_soft(update_rule_count, 1,225)    
 
 pyg.app.run()
+worker.stop()
 
 
 print "Stopped at step: %d" %(myspace.master_count)
+if myspace.absorbed != None:
+    print "The run was %s at step %d" %(myspace.absorbed, myspace.absorbed_at)
 
 # print_data(name, myspace, myRuleNet, cells)
 
@@ -1,31 +1,7 @@
 import matplotlib.pyplot as plt
-
-
-
-def get_step_count(PRODUCT_TYPES):
-    """A utility function to determine how long to run the model.
-    """
-
-    STEPS = 270000
-    
-    if PRODUCT_TYPES == 3:
-        STEPS = 410000
-    elif PRODUCT_TYPES == 4:
-        STEPS = 580000
-    elif PRODUCT_TYPES == 5:
-        STEPS = 770000
-    elif PRODUCT_TYPES == 6:
-        STEPS = 980000
-    elif PRODUCT_TYPES == 7:
-        STEPS = 1210000
-    elif PRODUCT_TYPES == 8:
-        STEPS = 1460000
-    elif PRODUCT_TYPES == 9:
-        STEPS = 1720000
-                         
-    return STEPS
-
-
+import numpy
+import AC_Results
+from AC_Headless import get_step_count
 
 
 PRODUCT_TYPES = [2,3,4,5,6,7,8,9]
@@ -46,65 +22,37 @@ for TYPES in PRODUCT_TYPES:
 			for URN in URN_TYPE:
 				for TOPO in TOPOLOGY:
 					mystr = "-".join([str(TYPES), CHEM, str(INTEL), URN, TOPO])
-					datafile = open(mystr+".csv","r+")
-					vals = []
-					three_vals = []
-					cells = []
-					rules = []
-					count_runs = 0.
-					step_count = get_step_count(TYPES)
-					
-					for line in datafile:
-						count_runs += 1
-						pre = line.replace("{","|").replace("}","|")
-						raw = pre.strip().split("|")
-						run = int(raw[0].replace(",",""))
-						precycles = raw[1].split(",")
-						cycles = {}
-						for i in precycles:
-							try:
-								j,k = i.split(":")
-								cycles[int(j)] = int(k)
-							except:
-								cycles = {}
-
-						after = raw[2].split(",")
-
-						if graph_type == "Cycles Alive":			
-							if int(after[4]) > step_count*.95:
-								if len(cycles.keys()) > 0:
-									vals.append(1)
-								else:
-									vals.append(0)
-
-						elif graph_type == "3+ Cycles Alive":
-							if cycles != {}:
-								if len(cycles.keys()) > 1:
-									vals.append(1)
-								else:
-									vals.append(0)
-							else:		
-								vals.append(0)
-
-						elif graph_type == "3+ Rules Alive":
-							if after[2]=='False':
-								vals.append(0)
-							else:
-								vals.append(1)
-
-						elif graph_type == "Cell Count":
-							cnt = 0
-							if int(after[4]) > step_count*.95:
-								if len(cycles.keys()) > 0:
-									vals.append(int(after[3]))
-									cnt += 1
-							count_runs = cnt
-
-
-              				try:
-              					stack[URN].append(sum(vals)/count_runs)
-              				except:
-              					stack[URN] = [sum(vals)/count_runs]
+					# NAME.rec if the sweep wrote one, otherwise the CSV
+					records = AC_Results.load_configuration(mystr, get_step_count(TYPES))
+					count_runs = float(len(records))
+
+					# the number of different cycle lengths in each run
+					lengths = (records["cycles"] > 0).sum(axis=1)
+					# absorbed runs (frozen or acyclic) count as having run the full length
+					absorbed = numpy.in1d(records["absorbed"], [AC_Results.ABSORBED.index(state) for state in ["frozen", "acyclic"]])
+					ends = numpy.where(absorbed, get_step_count(TYPES), records["steps"])
+					late = records["last_added_rule"] > ends*.95
+
+					if graph_type == "Cycles Alive":
+						value = (late & (lengths > 0)).sum()/count_runs
+
+					elif graph_type == "3+ Cycles Alive":
+						value = (lengths > 1).sum()/count_runs
+
+					elif graph_type == "3+ Rules Alive":
+						value = records["plus3rule"].sum()/count_runs
+
+					elif graph_type == "Cell Count":
+						alive = records["alive"][late & (lengths > 0)]
+						if len(alive) > 0:
+							value = alive.mean()
+						else:
+							value = 0.
+
+					try:
+						stack[URN].append(value)
+					except:
+						stack[URN] = [value]
 
 print stack
 x = [2,3,4,5,6,7,8,9]
@@ -0,0 +1,78 @@
+""" Checks of AC_ArrayModel against the object model.
+
+    python -m unittest test_AC_ArrayModel
+
+
+Written by Jon Atwell
+"""
+
+import AC_ArrayModel
+import AC_Headless
+import random
+import unittest
+
+
+COSTS = {"pass":1/3., "transform":1/3., "reproduce": 1/3.}
+
+
+class TestStorage(unittest.TestCase):
+
+    def get_model(self):
+        model = AC_ArrayModel.ArrayModel(2, 2, random.Random(1), "endo-rich",
+            COSTS, 10)
+        model.add_rule(0, 0, 1)
+        model.active_rule[0] = (0, 1)
+        return model
+
+
+    def test_last_stored_first_taken(self):
+        model = self.get_model()
+        energies = [10 - k/3. for k in range(3 * AC_ArrayModel.CAPACITY)]
+        for energy in energies:
+            model.store(0, 1, energy)
+        taken = []
+        while model.size[0, 1] > 0:
+            taken.append(model.take_stored(0, 1))
+        self.assertEqual(taken, energies[::-1])
+        self.assertEqual(model.take_stored(0, 1), None)
+
+
+    def test_energy_left_by_float_costs(self):
+        # 10 less 30 costs of 1/3 leaves 3.3e-16, so like a Product it
+        # still counts as having energy and goes back into the urn
+        energy = 10
+        for k in range(30):
+            energy -= 1/3.
+        self.assertTrue(energy > 0)
+
+        model = self.get_model()
+        model.store(0, 0, energy)
+        before = model.urn[0]
+        model.chain_step(0)
+        self.assertEqual(model.urn[0], before + 1)
+
+        # with none left it is dropped
+        model.store(0, 0, 0.)
+        model.chain_step(0)
+        self.assertEqual(model.urn[0], before + 1)
+
+
+    def test_from_space(self):
+        headless = AC_Headless.HeadlessModel(3, "endo-rich", "target", 3,
+            verbose=False)
+        headless.run(5000)
+        cells = headless.space.cell_index.cells
+        model = AC_ArrayModel.ArrayModel.from_space(headless.space)
+
+        for c, cell in enumerate(cells):
+            for t in range(1, 4):
+                stored = cell.products.get(t, [])
+                self.assertEqual(model.products[c, t-1], len(stored))
+                while stored != []:
+                    self.assertEqual(model.take_stored(c, t-1),
+                        cell.remove_Product(t).get_energy())
+
+
+
+if __name__ == "__main__":
+    unittest.main()
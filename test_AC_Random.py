@@ -0,0 +1,75 @@
+""" Checks of AC_Random.
+
+    python -m unittest test_AC_Random
+
+
+Written by Jon Atwell
+"""
+
+import AC_Random
+import random
+import unittest
+
+
+class TestBlockRandom(unittest.TestCase):
+
+    def test_same_numbers_as_random(self):
+        generator = AC_Random.BlockRandom(7, block=16)
+        reference = random.Random(7)
+        self.assertEqual([generator.random() for i in range(40)],
+            [reference.random() for i in range(40)])
+
+
+    def test_array_is_the_next_numbers(self):
+        generator = AC_Random.BlockRandom(7, block=16)
+        reference = random.Random(7)
+        numbers = [reference.random() for i in range(100)]
+
+        self.assertEqual(generator.random(), numbers[0])
+        self.assertEqual(generator.random_array().tolist(), numbers[1:17])
+        self.assertEqual(generator.random_array(50).tolist(), numbers[17:67])
+        self.assertEqual([generator.random() for i in range(33)],
+            numbers[67:])
+
+
+
+class TestJumpahead(unittest.TestCase):
+
+    def get_stream(self, n, seed=7, drawn=10):
+        """ The numbers a BlockRandom gives after DRAWN draws and a
+        jumpahead(N).
+        """
+
+        generator = AC_Random.BlockRandom(seed, block=16)
+        for i in range(drawn):
+            generator.random()
+        generator.jumpahead(n)
+        return [generator.random() for i in range(40)]
+
+
+    def test_same_n_same_stream(self):
+        self.assertEqual(self.get_stream(5), self.get_stream(5))
+
+
+    def test_different_n_different_streams(self):
+        self.assertNotEqual(self.get_stream(5), self.get_stream(6))
+
+
+    def test_depends_on_state(self):
+        self.assertNotEqual(self.get_stream(5), self.get_stream(5, drawn=11))
+        self.assertNotEqual(self.get_stream(5), self.get_stream(5, seed=8))
+
+
+    def test_leaves_the_stream(self):
+        generator = AC_Random.BlockRandom(7, block=16)
+        ahead = [generator.random() for i in range(40)]
+        generator = AC_Random.BlockRandom(7, block=16)
+        generator.random()
+        generator.jumpahead(1)
+        self.assertNotEqual([generator.random() for i in range(39)],
+            ahead[1:])
+
+
+
+if __name__ == "__main__":
+    unittest.main()